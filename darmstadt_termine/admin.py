@@ -3,10 +3,16 @@ from django.contrib import admin
 from .models import (
     Appointment,
     AppointmentCategory,
+    AppointmentChange,
     AppointmentType,
+    Availability,
+    DailyAvailability,
     Department,
     Location,
     Notification,
+    OutboxMessage,
+    PollSchedule,
+    ResponseFingerprint,
     ScraperRun,
 )
 
@@ -25,6 +31,36 @@ class AppointmentAdmin(admin.ModelAdmin):
     autocomplete_fields = ("appointment_type", "location")
 
 
+@admin.register(Availability)
+class AvailabilityAdmin(admin.ModelAdmin):
+    list_display = ("appointment", "first_seen_run", "last_seen_run")
+    list_select_related = ("appointment", "first_seen_run", "last_seen_run")
+    raw_id_fields = ("appointment", "first_seen_run", "last_seen_run")
+
+
+@admin.register(AppointmentChange)
+class AppointmentChangeAdmin(admin.ModelAdmin):
+    list_display = ("scraper_run", "appointment", "added")
+    list_filter = ("added",)
+    list_select_related = ("scraper_run", "appointment")
+    raw_id_fields = ("scraper_run", "appointment")
+
+
+@admin.register(DailyAvailability)
+class DailyAvailabilityAdmin(admin.ModelAdmin):
+    date_hierarchy = "day"
+    list_display = (
+        "day",
+        "appointment_type",
+        "location",
+        "appointments",
+        "appointments_added",
+        "appointments_removed",
+    )
+    list_filter = ("day", "location", "appointment_type")
+    list_select_related = ("appointment_type", "location")
+
+
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = (
@@ -38,6 +74,7 @@ class NotificationAdmin(admin.ModelAdmin):
     )
     list_filter = ("creation_date", "last_sent", "active")
     autocomplete_fields = ("appointment_type",)
+    raw_id_fields = ("last_notified_run",)
     actions = [
         "activate_action",
         "deactivate_action",
@@ -74,6 +111,16 @@ class NotificationAdmin(admin.ModelAdmin):
     unconfirm_action.short_description = "E-Mails deaktivieren"
 
 
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    date_hierarchy = "creation_date"
+    list_display = ("email", "subject", "creation_date", "sent", "attempts")
+    list_filter = ("sent", "creation_date")
+    search_fields = ("email",)
+    raw_id_fields = ("notification",)
+    readonly_fields = ("creation_date",)
+
+
 @admin.register(AppointmentType)
 class AppointmentTypeAdmin(admin.ModelAdmin):
     list_display = ("name", "index", "active", "appointment_category")
@@ -104,8 +151,44 @@ class AppointmentCategoryAdmin(admin.ModelAdmin):
 
 @admin.register(ScraperRun)
 class ScraperRunAdmin(admin.ModelAdmin):
-    list_display = ("start_time", "end_time")
-    list_filter = ("start_time", "end_time")
+    date_hierarchy = "start_time"
+    list_display = (
+        "start_time",
+        "end_time",
+        "status",
+        "requests",
+        "bytes_fetched",
+        "http_time",
+        "parse_time",
+        "db_time",
+        "slots_seen",
+        "slots_new",
+        "slots_removed",
+        "retries",
+        "errors",
+    )
+    list_filter = ("status", "start_time", "end_time")
+    readonly_fields = list_display
+
+
+@admin.register(ResponseFingerprint)
+class ResponseFingerprintAdmin(admin.ModelAdmin):
+    list_display = ("appointment_type", "location", "scraper_run", "digest")
+    list_filter = ("location", "appointment_type")
+    list_select_related = ("scraper_run", "appointment_type")
+    raw_id_fields = ("scraper_run",)
+
+
+@admin.register(PollSchedule)
+class PollScheduleAdmin(admin.ModelAdmin):
+    list_display = (
+        "appointment_type",
+        "location",
+        "interval",
+        "next_poll",
+        "last_change",
+    )
+    list_filter = ("location", "appointment_type")
 
 
 @admin.register(Location)
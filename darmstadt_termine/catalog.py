@@ -0,0 +1,64 @@
+from typing import NamedTuple
+
+from .models import AppointmentType, Location
+
+
+class CategorySnapshot(NamedTuple):
+    """
+    CategorySnapshot holds the active appointment types of an appointment category with the locations they are offered at.
+    """
+
+    department_index: int
+    index: int
+    requests: tuple[tuple[AppointmentType, Location], ...]
+
+
+class CatalogSnapshot(NamedTuple):
+    """
+    CatalogSnapshot holds all active appointment types with their categories, departments and locations as loaded at the start of a scraper run.
+    """
+
+    categories: tuple[CategorySnapshot, ...]
+
+
+def load_catalog() -> CatalogSnapshot:
+    """
+    load_catalog loads the active catalog with a single query over the locations of the appointment types
+
+    Returns:
+        CatalogSnapshot: the snapshot of the catalog
+    """
+    offers = (
+        AppointmentType.location.through.objects.filter(appointmenttype__active=True)
+        .select_related("appointmenttype__appointment_category__department", "location")
+        .order_by(
+            "appointmenttype__appointment_category",
+            "appointmenttype__index",
+            "location__index",
+        )
+    )
+
+    # instances are shared, so that every appointment type and location is only held once
+    appointment_types: dict[int, AppointmentType] = {}
+    locations: dict[int, Location] = {}
+    categories: dict[int, tuple[int, int, list]] = {}
+    for offer in offers:
+        appointment_type = appointment_types.setdefault(
+            offer.appointmenttype_id, offer.appointmenttype
+        )
+        location = locations.setdefault(offer.location_id, offer.location)
+        appointment_category = appointment_type.appointment_category
+        if appointment_category.pk not in categories:
+            categories[appointment_category.pk] = (
+                appointment_category.department.index,
+                appointment_category.index,
+                [],
+            )
+        categories[appointment_category.pk][2].append((appointment_type, location))
+
+    return CatalogSnapshot(
+        tuple(
+            CategorySnapshot(department_index, index, tuple(requests))
+            for department_index, index, requests in categories.values()
+        )
+    )
@@ -11,6 +11,31 @@ class DarmstadtTermineAppConf(AppConf):
     - DELETION_TIMEOUT: Specifies how many seconds the deletion token is valid (Default: 30 days)
     - AVAILABLE_LANGUAGES: All the translated languages users should be able to select as a tuple ready for use as a choices in a model
     - DELETE_UNCONFIRMED_NOTIFICATIONS_AFTER: Specifies after how many seconds unconfirmed Notifications should be deleted (Default: ACTIVATION_TIMEOUT + 1 day)
+    - HISTORY_RETENTION: Specifies for how many seconds the detailed history of the scraper runs is kept before compact_history rolls it up into daily aggregates, the history after the last notified scraper run of an active notification is always kept (Default: 30 days)
+    - HISTORY_DELETE_CHUNK_SIZE: Specifies how many rows compact_history deletes at once, so that the tables are not locked for long (Default: 1000)
+    - OUTBOX_BATCH_SIZE: Specifies how many emails process_outbox delivers at once over the same connection (Default: 100)
+    - OUTBOX_MAX_ATTEMPTS: Specifies how many times process_outbox tries to deliver an email before giving up (Default: 5)
+    - OUTBOX_RETRY_BACKOFF: Specifies how many seconds process_outbox waits before the first retry of a failed email, the delay doubles with every retry (Default: 60)
+    - OUTBOX_CLAIM_TIMEOUT: Specifies for how many seconds process_outbox reserves the emails it is delivering, emails whose delivery was interrupted are delivered again afterwards (Default: 10 minutes)
+    - OUTBOX_RETENTION: Specifies for how many seconds emails which were sent or failed for the last time are kept before compact_history deletes them (Default: 7 days)
+    - SCRAPER_URL: Specifies the url of tevis, for example to use a local stand-in (Default: None, the url of Darmstadt)
+    - SCRAPER_REPLAY: A dict with the keys directory, latency, error_rate and slot_scale. If set the scraper does not send requests to tevis, but gets the responses recorded in directory with scraper_run --record (Default: None)
+    - SCRAPER_MAX_CONCURRENCY: Specifies how many requests the scraper may send at the same time (Default: 16)
+    - SCRAPER_MAX_CONCURRENCY_PER_HOST: Specifies how many requests the scraper may send to a single host at the same time. The scraper raises its concurrency up to this limit while the host responds fast and halves it if the host throttles or fails (Default: 16)
+    - SCRAPER_MIN_CONCURRENCY_PER_HOST: Specifies how many requests the scraper may always send to a single host at the same time (Default: 1)
+    - SCRAPER_INITIAL_CONCURRENCY_PER_HOST: Specifies how many requests the scraper starts to send to a single host at the same time (Default: 4)
+    - SCRAPER_MAX_RETRIES: Specifies how many times a failed, throttled or timed out request is sent again before the appointments found before are kept (Default: 3)
+    - SCRAPER_RETRY_BACKOFF: Specifies how many seconds the scraper waits before the first retry, the delay doubles with every retry (Default: 1)
+    - SCRAPER_SESSIONS_PER_CATEGORY: Specifies how many tevis sessions the scraper uses per appointment category at the same time, each session only handles one request at a time (Default: 4)
+    - SCRAPER_SESSION_TIMEOUT: Specifies after how many idle seconds a tevis session has to be opened again (Default: 5 minutes)
+    - SCRAPER_HTTP2: Specifies whether the scraper uses HTTP/2, requires the h2 package (Default: False)
+    - SCRAPER_POLL_INTERVAL_MIN: Specifies the shortest amount of seconds between two requests for an appointment type at a location (Default: 60)
+    - SCRAPER_POLL_INTERVAL_MAX: Specifies the longest amount of seconds between two requests for an appointment type at a location (Default: 1 hour)
+    - SCRAPER_POLL_INTERVAL_FACTOR: Specifies by which factor the poll interval grows if the response did not change, it is halved if the response changed (Default: 1.5)
+    - SCRAPER_QUIET_HOURS: Tuples of start and end datetime.time during which only appointment types which were never requested are requested, for example when the office system is closed (Default: no quiet hours)
+    - SCRAPER_STREAMING_PARSER: Specifies whether tevis responses are parsed while they are received instead of after they were received completely, which keeps less of them in memory. Unchanged responses are then recognized by their parsed appointments (Default: False)
+    - SCRAPER_RUN_TIMEOUT: Specifies after how many seconds a scraper run which did not complete is considered crashed, only one scraper run may be running at a time (Default: 1 hour)
+    - SCRAPER_FINGERPRINT_IGNORE_PATTERNS: Regular expressions matching parts of a tevis response which change with every request and are ignored when comparing responses, matched case insensitive (Default: session ids and form tokens)
     """
 
     ACTIVATION_TIMEOUT = 172800
@@ -18,6 +43,35 @@ class DarmstadtTermineAppConf(AppConf):
     DELETION_TIMEOUT = 2592000
     AVAILABLE_LANGUAGES = [("de", "Deutsch"), ("en", "English")]
     DELETE_UNCONFIRMED_NOTIFICATIONS_AFTER = ACTIVATION_TIMEOUT + 86400
+    HISTORY_RETENTION = 2592000
+    HISTORY_DELETE_CHUNK_SIZE = 1000
+    OUTBOX_BATCH_SIZE = 100
+    OUTBOX_MAX_ATTEMPTS = 5
+    OUTBOX_RETRY_BACKOFF = 60
+    OUTBOX_CLAIM_TIMEOUT = 600
+    OUTBOX_RETENTION = 604800
+    SCRAPER_URL = None
+    SCRAPER_REPLAY = None
+    SCRAPER_MAX_CONCURRENCY = 16
+    SCRAPER_MAX_CONCURRENCY_PER_HOST = 16
+    SCRAPER_MIN_CONCURRENCY_PER_HOST = 1
+    SCRAPER_INITIAL_CONCURRENCY_PER_HOST = 4
+    SCRAPER_MAX_RETRIES = 3
+    SCRAPER_RETRY_BACKOFF = 1
+    SCRAPER_SESSIONS_PER_CATEGORY = 4
+    SCRAPER_SESSION_TIMEOUT = 300
+    SCRAPER_HTTP2 = False
+    SCRAPER_POLL_INTERVAL_MIN = 60
+    SCRAPER_POLL_INTERVAL_MAX = 3600
+    SCRAPER_POLL_INTERVAL_FACTOR = 1.5
+    SCRAPER_QUIET_HOURS = ()
+    SCRAPER_STREAMING_PARSER = False
+    SCRAPER_RUN_TIMEOUT = 3600
+    SCRAPER_FINGERPRINT_IGNORE_PATTERNS = (
+        r";jsessionid=[^\"'?#]*",
+        r"(?:PHPSESSID|sid)=[^\"'&#]*",
+        r"<input[^>]*name=[\"'][^\"']*(?:token|csrf)[^\"']*[\"'][^>]*>",
+    )
 
     def configure(self):
         if hasattr(settings, f"{self._meta.prefix.upper()}_ACTIVATION_TIMEOUT"):
@@ -0,0 +1,225 @@
+import asyncio
+import concurrent.futures
+import json
+import time
+import tracemalloc
+
+import httpx
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+
+from ...conf import settings
+from ...models import AppointmentCategory, AppointmentType, Department, Location
+from ...replay import SyntheticTevisApp
+from ...scraper import fetch_all_types
+from ...session_pool import SessionPool
+
+TYPES_PER_CATEGORY = 10
+
+
+def create_catalog(types: int, locations: int):
+    """
+    create_catalog creates a department with the amount of appointment types, each offered at all locations.
+    Every appointment category gets up to TYPES_PER_CATEGORY appointment types.
+
+    Args:
+        types (int): the amount of appointment types
+        locations (int): the amount of locations
+    """
+    department = Department.objects.create(name="Benchmark", index=1)
+    categories = AppointmentCategory.objects.bulk_create(
+        AppointmentCategory(
+            name=f"Kategorie {index}", index=index, department=department
+        )
+        for index in range(1, (types - 1) // TYPES_PER_CATEGORY + 2)
+    )
+    created_locations = Location.objects.bulk_create(
+        Location(name=f"Standort {index}", descriptor=f"Standort {index}", index=index)
+        for index in range(1, locations + 1)
+    )
+    appointment_types = AppointmentType.objects.bulk_create(
+        AppointmentType(
+            name=f"Termin {index}",
+            index=index,
+            appointment_category=categories[index // TYPES_PER_CATEGORY],
+        )
+        for index in range(types)
+    )
+    AppointmentType.location.through.objects.bulk_create(
+        AppointmentType.location.through(
+            appointmenttype=appointment_type, location=location
+        )
+        for appointment_type in appointment_types
+        for location in created_locations
+    )
+
+
+class Command(BaseCommand):
+    help = "Benchmarks the web scraper against a synthetic tevis in a separate test database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--types",
+            help="the amount of appointment types of each benchmarked catalog",
+            type=int,
+            nargs="+",
+            default=[10, 100, 1000],
+        )
+        parser.add_argument(
+            "--locations",
+            help="the amount of locations each appointment type is offered at",
+            type=int,
+            default=5,
+        )
+        parser.add_argument(
+            "--slots",
+            help="the amount of appointments on every result page",
+            type=int,
+            default=20,
+        )
+        parser.add_argument(
+            "--runs",
+            help="the amount of scraper runs per catalog, the first run creates all appointments",
+            type=int,
+            default=3,
+        )
+        parser.add_argument(
+            "--latency",
+            help="the average amount of seconds each response is delayed",
+            type=float,
+            default=0,
+        )
+        parser.add_argument(
+            "--change-rate",
+            help="the share of result pages which change between two scraper runs",
+            type=float,
+            default=1,
+        )
+        parser.add_argument(
+            "--parse-workers",
+            help="parse the responses in this amount of worker processes instead of the event loop",
+            type=int,
+            default=0,
+            metavar="N",
+        )
+        parser.add_argument(
+            "--output",
+            help="write the results as JSON to this file",
+            metavar="FILE",
+        )
+
+    def handle(self, *args, **options):
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            # every appointment type is requested in every run and the queries are not logged
+            with override_settings(
+                DEBUG=False,
+                DARMSTADT_TERMINE_SCRAPER_POLL_INTERVAL_MIN=0,
+                DARMSTADT_TERMINE_SCRAPER_POLL_INTERVAL_MAX=0,
+                DARMSTADT_TERMINE_SCRAPER_QUIET_HOURS=(),
+            ):
+                results = [
+                    self._benchmark(size, **options) for size in options["types"]
+                ]
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options.get("output"):
+            with open(options["output"], "w") as output_file:
+                json.dump(
+                    {
+                        "options": {
+                            key: options[key]
+                            for key in (
+                                "types",
+                                "locations",
+                                "slots",
+                                "runs",
+                                "latency",
+                                "change_rate",
+                                "parse_workers",
+                            )
+                        },
+                        "results": results,
+                    },
+                    output_file,
+                    indent=2,
+                )
+
+    def _benchmark(self, size: int, **options) -> dict:
+        call_command("flush", interactive=False, verbosity=0)
+        create_catalog(size, options["locations"])
+        app = SyntheticTevisApp(
+            options["slots"],
+            latency=options["latency"],
+            change_rate=options["change_rate"],
+        )
+
+        parse_executor = None
+        if options["parse_workers"]:
+            parse_executor = concurrent.futures.ProcessPoolExecutor(
+                options["parse_workers"]
+            )
+        tracemalloc.start()
+        try:
+            runs = asyncio.run(self._run(app, options["runs"], parse_executor))
+        finally:
+            tracemalloc.stop()
+            if parse_executor is not None:
+                parse_executor.shutdown()
+
+        for index, run in enumerate(runs):
+            self.stdout.write(
+                f"{size} types, run {index + 1}: {run['wall_time']:.2f}s, "
+                f"{run['requests']} requests ({run['requests_per_second']:.1f}/s), "
+                f"http {run['http_time']:.2f}s, parse {run['parse_time']:.2f}s, "
+                f"db {run['db_time']:.2f}s, peak memory {run['peak_memory'] / 2**20:.1f} MiB"
+            )
+        return {
+            "types": size,
+            "locations": options["locations"],
+            "slots": options["slots"],
+            "runs": runs,
+        }
+
+    async def _run(
+        self,
+        app: SyntheticTevisApp,
+        runs: int,
+        parse_executor: concurrent.futures.Executor | None,
+    ) -> list[dict]:
+        results = []
+        async with SessionPool(
+            "http://tevis.benchmark/",
+            settings.DARMSTADT_TERMINE_SCRAPER_SESSIONS_PER_CATEGORY,
+            settings.DARMSTADT_TERMINE_SCRAPER_SESSION_TIMEOUT,
+            transport=httpx.ASGITransport(app),
+        ) as session_pool:
+            for _ in range(runs):
+                requests = app.requests
+                tracemalloc.reset_peak()
+                start_time = time.perf_counter()
+                stats = await fetch_all_types(
+                    session_pool, parse_executor=parse_executor
+                )
+                wall_time = time.perf_counter() - start_time
+                requests = app.requests - requests
+                results.append(
+                    {
+                        "wall_time": wall_time,
+                        "requests": requests,
+                        "requests_per_second": requests / wall_time,
+                        "bytes_fetched": stats.bytes_fetched,
+                        "slots_seen": stats.slots_seen,
+                        "http_time": stats.http_time,
+                        "parse_time": stats.parse_time,
+                        "db_time": stats.db_time,
+                        "peak_memory": tracemalloc.get_traced_memory()[1],
+                    }
+                )
+        return results
@@ -0,0 +1,251 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, QuerySet
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from ...conf import settings
+from ...models import (
+    Appointment,
+    AppointmentChange,
+    Availability,
+    DailyAvailability,
+    Notification,
+    OutboxMessage,
+    ResponseFingerprint,
+    ScraperRun,
+)
+
+
+def delete_in_chunks(queryset: QuerySet, chunk_size: int) -> int:
+    """
+    delete_in_chunks deletes the rows of the queryset in chunks of chunk_size rows,
+    every chunk is deleted in its own transaction, so that the table is never locked for long
+
+    Args:
+        queryset (QuerySet): the rows to delete
+        chunk_size (int): the amount of rows deleted at once
+
+    Returns:
+        int: the amount of deleted rows
+    """
+    deleted = 0
+    while pks := list(queryset.values_list("pk", flat=True)[:chunk_size]):
+        queryset.model.objects.filter(pk__in=pks).delete()
+        deleted += len(pks)
+    return deleted
+
+
+def update_in_chunks(queryset: QuerySet, chunk_size: int, **values) -> int:
+    """
+    update_in_chunks updates the rows of the queryset in chunks of chunk_size rows like delete_in_chunks.
+    The update has to remove the rows from the queryset, otherwise it never ends.
+
+    Args:
+        queryset (QuerySet): the rows to update
+        chunk_size (int): the amount of rows updated at once
+
+    Returns:
+        int: the amount of updated rows
+    """
+    updated = 0
+    while pks := list(queryset.values_list("pk", flat=True)[:chunk_size]):
+        queryset.model.objects.filter(pk__in=pks).update(**values)
+        updated += len(pks)
+    return updated
+
+
+def roll_up_day(day: datetime.date, first_run_id: int, last_run_id: int) -> int:
+    """
+    roll_up_day creates the :model:`darmstadt_termine.DailyAvailability`s of a day from the detailed history of its scraper runs.
+    Days which were already rolled up are kept, so that an interrupted compaction can be repeated.
+
+    Args:
+        day (datetime.date): the day
+        first_run_id (int): the id of the first scraper run of the day
+        last_run_id (int): the id of the last scraper run of the day
+
+    Returns:
+        int: the amount of aggregates
+    """
+    daily_availabilities: dict[tuple[int, int | None], DailyAvailability] = {}
+
+    def get_daily_availability(appointment_type: int, location: int | None):
+        if (appointment_type, location) not in daily_availabilities:
+            daily_availabilities[appointment_type, location] = DailyAvailability(
+                day=day, appointment_type_id=appointment_type, location_id=location
+            )
+        return daily_availabilities[appointment_type, location]
+
+    available = (
+        Availability.objects.filter(
+            first_seen_run__lte=last_run_id, last_seen_run__gte=first_run_id
+        )
+        .values("appointment__appointment_type", "appointment__location")
+        .annotate(appointments=Count("appointment", distinct=True))
+        .order_by()
+    )
+    for row in available:
+        get_daily_availability(
+            row["appointment__appointment_type"], row["appointment__location"]
+        ).appointments = row["appointments"]
+
+    changes = (
+        AppointmentChange.objects.filter(
+            scraper_run__gte=first_run_id, scraper_run__lte=last_run_id
+        )
+        .values("appointment__appointment_type", "appointment__location")
+        .annotate(
+            appointments_added=Count("pk", filter=Q(added=True)),
+            appointments_removed=Count("pk", filter=Q(added=False)),
+        )
+        .order_by()
+    )
+    for row in changes:
+        daily_availability = get_daily_availability(
+            row["appointment__appointment_type"], row["appointment__location"]
+        )
+        daily_availability.appointments_added = row["appointments_added"]
+        daily_availability.appointments_removed = row["appointments_removed"]
+
+    DailyAvailability.objects.bulk_create(
+        daily_availabilities.values(), ignore_conflicts=True
+    )
+    return len(daily_availabilities)
+
+
+class Command(BaseCommand):
+    help = "Rolls the detailed history of old scraper runs up into daily aggregates and deletes it, also deletes old delivered emails from the outbox"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            help="compact the history of the scraper runs older than this amount of days (Default: HISTORY_RETENTION)",
+            type=int,
+            metavar="DAYS",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            help="the amount of rows deleted at once (Default: HISTORY_DELETE_CHUNK_SIZE)",
+            type=int,
+            default=settings.DARMSTADT_TERMINE_HISTORY_DELETE_CHUNK_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        if options["older_than"] is not None:
+            retention = datetime.timedelta(days=options["older_than"])
+        else:
+            retention = datetime.timedelta(
+                seconds=settings.DARMSTADT_TERMINE_HISTORY_RETENTION
+            )
+        chunk_size = options["chunk_size"]
+
+        outbox_cutoff = timezone.now() - datetime.timedelta(
+            seconds=settings.DARMSTADT_TERMINE_OUTBOX_RETENTION
+        )
+        deleted_outbox_messages = delete_in_chunks(
+            OutboxMessage.objects.filter(
+                Q(sent__lt=outbox_cutoff)
+                | Q(
+                    sent__isnull=True,
+                    attempts__gte=settings.DARMSTADT_TERMINE_OUTBOX_MAX_ATTEMPTS,
+                    next_attempt__lt=outbox_cutoff,
+                )
+            ),
+            chunk_size,
+        )
+        self.stdout.write(f"Deleted {deleted_outbox_messages} emails from the outbox")
+
+        # only whole days are compacted, so that every day is rolled up exactly once
+        cutoff = timezone.localtime(timezone.now() - retention).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+
+        # the latest completed scraper run is always kept, the next scraper run continues its availabilities
+        first_kept_run = (
+            ScraperRun.objects.filter(start_time__gte=cutoff)
+            .order_by("start_time")
+            .first()
+        )
+        last_completed_run = (
+            ScraperRun.objects.filter(status=ScraperRun.Status.COMPLETED)
+            .order_by("-start_time")
+            .first()
+        )
+        if last_completed_run is not None and (
+            first_kept_run is None or last_completed_run.pk < first_kept_run.pk
+        ):
+            first_kept_run = last_completed_run
+        first_kept_run = (
+            first_kept_run or ScraperRun.objects.order_by("-start_time").first()
+        )
+        if first_kept_run is None:
+            return
+        # the appointments added after the last notified scraper runs of the notifications are still sent to them
+        oldest_notified_run = (
+            ScraperRun.objects.filter(
+                notifications__active=True, notifications__confirmed=True
+            )
+            .order_by("pk")
+            .first()
+        )
+        if (
+            oldest_notified_run is not None
+            and oldest_notified_run.pk < first_kept_run.pk
+        ):
+            first_kept_run = oldest_notified_run
+        old_runs = ScraperRun.objects.filter(pk__lt=first_kept_run.pk)
+
+        days = (
+            old_runs.annotate(day=TruncDate("start_time"))
+            .values("day")
+            .annotate(first_run_id=Min("pk"), last_run_id=Max("pk"))
+            .order_by("day")
+        )
+        rolled_up = 0
+        for day in days:
+            with transaction.atomic():
+                rolled_up += roll_up_day(
+                    day["day"], day["first_run_id"], day["last_run_id"]
+                )
+
+        deleted_availabilities = delete_in_chunks(
+            Availability.objects.filter(last_seen_run__lt=first_kept_run.pk),
+            chunk_size,
+        )
+        # availabilities which continue after the compacted history start with the first kept scraper run
+        update_in_chunks(
+            Availability.objects.filter(first_seen_run__lt=first_kept_run.pk),
+            chunk_size,
+            first_seen_run=first_kept_run,
+        )
+        deleted_changes = delete_in_chunks(
+            AppointmentChange.objects.filter(scraper_run__lt=first_kept_run.pk),
+            chunk_size,
+        )
+        deleted_appointments = delete_in_chunks(
+            Appointment.objects.filter(
+                availabilities__isnull=True, changes__isnull=True
+            ),
+            chunk_size,
+        )
+        # the response fingerprints would be deleted with their scraper runs,
+        # the notifications only send the appointments added after their last notified scraper run
+        deleted_runs = delete_in_chunks(
+            old_runs.exclude(
+                pk__in=ResponseFingerprint.objects.values("scraper_run")
+            ).exclude(
+                pk__in=Notification.objects.filter(
+                    last_notified_run__isnull=False
+                ).values("last_notified_run")
+            ),
+            chunk_size,
+        )
+
+        self.stdout.write(
+            f"{rolled_up} daily aggregates created, deleted {deleted_runs} scraper runs, "
+            f"{deleted_appointments} appointments, {deleted_availabilities} availabilities "
+            f"and {deleted_changes} appointment changes"
+        )
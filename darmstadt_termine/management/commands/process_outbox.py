@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from ...conf import settings
+from ...utils.outbox import deliver_outbox
+
+
+class Command(BaseCommand):
+    help = "Delivers the emails in the outbox which are due"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            help="the amount of emails delivered at once over the same connection (Default: OUTBOX_BATCH_SIZE)",
+            type=int,
+            default=settings.DARMSTADT_TERMINE_OUTBOX_BATCH_SIZE,
+        )
+        parser.add_argument(
+            "--max-attempts",
+            help="the amount of times an email is tried to be delivered (Default: OUTBOX_MAX_ATTEMPTS)",
+            type=int,
+            default=settings.DARMSTADT_TERMINE_OUTBOX_MAX_ATTEMPTS,
+        )
+
+    def handle(self, *args, **options):
+        result = deliver_outbox(options["batch_size"], options["max_attempts"])
+        self.stdout.write(
+            f"{result.sent} emails sent, {result.failed} failed and will be retried, "
+            f"{result.given_up} failed for the last time"
+        )
@@ -1,8 +1,15 @@
 import asyncio
+import concurrent.futures
+import signal
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-from ...scraper import fetch_all_types
+from ...scraper import (
+    ScraperRunInProgress,
+    create_session_pool,
+    fetch_all_types,
+    run_daemon,
+)
 
 
 class Command(BaseCommand):
@@ -10,6 +17,29 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("--profile", action="store_true", default=False)
+        parser.add_argument(
+            "--daemon",
+            help="keep running and start a scraper run every --interval seconds until SIGINT or SIGTERM is received",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--interval",
+            help="the amount of seconds between the starts of two scraper runs in daemon mode",
+            type=float,
+            default=60,
+        )
+        parser.add_argument(
+            "--record",
+            help="record all requests and responses to this directory, they can be replayed with the SCRAPER_REPLAY setting",
+            metavar="DIRECTORY",
+        )
+        parser.add_argument(
+            "--parse-workers",
+            help="parse the responses in this amount of worker processes instead of the event loop",
+            type=int,
+            default=0,
+            metavar="N",
+        )
 
     def handle(self, *args, **options):
         if options.get("profile", False):
@@ -28,4 +58,39 @@ class Command(BaseCommand):
             self._handle(*args, **options)
 
     def _handle(self, *args, **options):
-        asyncio.run(fetch_all_types())
+        asyncio.run(self._run(**options))
+
+    async def _run(self, **options):
+        parse_executor = None
+        if options.get("parse_workers"):
+            parse_executor = concurrent.futures.ProcessPoolExecutor(
+                options["parse_workers"]
+            )
+        try:
+            async with create_session_pool(options.get("record")) as session_pool:
+                if options.get("daemon", False):
+                    await self._run_daemon(
+                        session_pool, options["interval"], parse_executor
+                    )
+                else:
+                    await fetch_all_types(session_pool, parse_executor=parse_executor)
+        except ScraperRunInProgress as error:
+            raise CommandError(error)
+        finally:
+            if parse_executor is not None:
+                parse_executor.shutdown()
+
+    async def _run_daemon(
+        self,
+        session_pool,
+        interval: float,
+        parse_executor: concurrent.futures.Executor | None,
+    ):
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signal_number, stop_event.set)
+
+        self.stdout.write(f"Scraper running every {interval} seconds")
+        await run_daemon(session_pool, interval, stop_event, parse_executor)
+        self.stdout.write("Scraper stopped")
@@ -1,18 +1,126 @@
+import collections
+import concurrent.futures
 from typing import Any
 
+import django
 from django.core import mail
 from django.core.management.base import BaseCommand, CommandParser
-from django.db.models import F, Prefetch
+from django.db import connections, transaction
+from django.db.models import F, Prefetch, QuerySet
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from ...models import Appointment, AppointmentType, Notification, ScraperRun
-from ...utils.email import create_notification_email_message_for_new_appointments
-from ...utils.models import APPOINTMENT_TIME_FILTER
+from ...models import (
+    Appointment,
+    AppointmentType,
+    Notification,
+    OutboxMessage,
+    ScraperRun,
+)
+from ...utils.email import (
+    NotificationEmailPayload,
+    create_notification_email_payload_for_new_appointments,
+    render_notification_email,
+)
+from ...utils.models import (
+    APPOINTMENT_TIME_FILTER,
+    AppointmentTuple,
+    get_appointments_since,
+    get_scraper_run_appointments,
+)
+from ...utils.outbox import create_outbox_message, deliver_outbox
+
+RENDER_BATCH_SIZE = 50
+DISPATCH_BATCH_SIZE = 500
+
+
+def get_notifications_by_appointment_type(
+    notifications: QuerySet[Notification],
+) -> dict[int, list[int]]:
+    """
+    get_notifications_by_appointment_type creates an index from the appointment type ids to the ids of the notifications subscribed to them
+
+    Args:
+        notifications (QuerySet[Notification]): the notifications to index
+
+    Returns:
+        dict[int, list[int]]: the ids of the subscribed notifications by appointment type id
+    """
+    notifications_by_type = collections.defaultdict(list)
+    for appointment_type_id, notification_id in (
+        Notification.appointment_type.through.objects.filter(
+            notification__in=notifications
+        )
+        .values_list("appointmenttype_id", "notification_id")
+        .iterator()
+    ):
+        notifications_by_type[appointment_type_id].append(notification_id)
+    return notifications_by_type
+
+
+def get_appointments_by_last_notified_run(
+    notifications: QuerySet[Notification],
+    last_scraper_run: ScraperRun,
+    last_found_appointments: set[AppointmentTuple],
+) -> dict[int | None, set[AppointmentTuple]]:
+    """
+    get_appointments_by_last_notified_run computes the appointments to send once for every distinct last notified scraper run of the notifications
+
+    Args:
+        notifications (QuerySet[Notification]): the notifications to send
+        last_scraper_run (ScraperRun): the last scraper run
+        last_found_appointments (set[AppointmentTuple]): the appointments found in the last scraper run
+
+    Returns:
+        dict[int | None, set[AppointmentTuple]]: the appointments to send by the id of the last notified scraper run
+    """
+    last_notified_run_ids = set(
+        notifications.order_by().values_list("last_notified_run", flat=True).distinct()
+    )
+    appointments_by_last_notified_run = {}
+    if None in last_notified_run_ids:
+        appointments_by_last_notified_run[None] = get_appointments_since(
+            last_scraper_run, None, last_found_appointments
+        )
+    for last_notified_run in ScraperRun.objects.filter(pk__in=last_notified_run_ids):
+        appointments_by_last_notified_run[last_notified_run.pk] = (
+            get_appointments_since(
+                last_scraper_run, last_notified_run, last_found_appointments
+            )
+        )
+    return appointments_by_last_notified_run
+
+
+def render_notification_emails(
+    email_payloads: list[NotificationEmailPayload],
+    executor: concurrent.futures.Executor | None = None,
+) -> list[mail.EmailMultiAlternatives]:
+    """
+    render_notification_emails renders the emails, in batches of RENDER_BATCH_SIZE emails per worker process if an executor is given
+
+    Args:
+        email_payloads (list[NotificationEmailPayload]): the payloads of the emails
+        executor (concurrent.futures.Executor | None, optional): the pool of worker processes. Defaults to None, which renders in this process.
+
+    Returns:
+        list[mail.EmailMultiAlternatives]: the email messages in the order of the payloads
+    """
+    if executor is None or len(email_payloads) <= RENDER_BATCH_SIZE:
+        return [render_notification_email(payload) for payload in email_payloads]
+
+    # the worker processes must not share the database connections of this process
+    connections.close_all()
+    return list(
+        executor.map(
+            render_notification_email,
+            email_payloads,
+            chunksize=RENDER_BATCH_SIZE,
+        )
+    )
 
 
 class Command(BaseCommand):
-    help = "Sends out Notifications either for the specified appointment types or all types."
+    help = "Writes the Notifications either for the specified appointment types or all types to the outbox and delivers it."
 
     def add_arguments(self, parser: CommandParser) -> None:
         parser.add_argument(
@@ -28,7 +136,21 @@ class Command(BaseCommand):
             action="store_true",
         )
         parser.add_argument(
-            "--no-update", help="Do not update last_sent timestamp", action="store_true"
+            "--workers",
+            help="render the emails in this amount of worker processes",
+            type=int,
+            default=0,
+            metavar="N",
+        )
+        parser.add_argument(
+            "--enqueue-only",
+            help="only write the emails to the outbox, they are delivered by process_outbox",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--no-update",
+            help="Do not update last_sent timestamp and last notified scraper run",
+            action="store_true",
         )
 
     def handle(self, *args: Any, **options: Any) -> None:
@@ -36,11 +158,6 @@ class Command(BaseCommand):
             last_sent__lt=timezone.now() - F("minimum_waittime"),
             active=True,
             confirmed=True,
-        ).prefetch_related(
-            Prefetch(
-                "appointment_type",
-                queryset=AppointmentType.objects.select_related("appointment_category"),
-            )
         )
         if options["appointment_type_ids"]:
             notifications = notifications.filter(
@@ -49,15 +166,13 @@ class Command(BaseCommand):
 
         protocol = "https" if not options.get("no_https", False) else "http"
 
-        email_messages = []
-
-        sent_notifications = []
         try:
-            last_scraper_run = ScraperRun.objects.prefetch_related(
-                "appointments"
+            last_scraper_run = ScraperRun.objects.filter(
+                status=ScraperRun.Status.COMPLETED
             ).latest("start_time")
             last_found_appointments = set(
-                last_scraper_run.appointments.filter(*APPOINTMENT_TIME_FILTER)
+                get_scraper_run_appointments(last_scraper_run)
+                .filter(*APPOINTMENT_TIME_FILTER)
                 .values_list(
                     "start_time",
                     "end_time",
@@ -71,44 +186,101 @@ class Command(BaseCommand):
         except ScraperRun.DoesNotExist:
             return
 
+        notifications_by_type = get_notifications_by_appointment_type(notifications)
+        appointments_by_last_notified_run = get_appointments_by_last_notified_run(
+            notifications, last_scraper_run, last_found_appointments
+        )
+        changed_appointment_types = {
+            appointment.appointment_type
+            for appointments in appointments_by_last_notified_run.values()
+            for appointment in appointments
+        }
+        # only the notifications subscribed to a changed appointment type can get new appointments
+        notification_ids = set()
+        for appointment_type in changed_appointment_types:
+            notification_ids.update(notifications_by_type.get(appointment_type, ()))
+
+        executor = None
+        if options["workers"]:
+            # the worker processes are not forked on every platform, so they set up django themselves to render the templates
+            executor = concurrent.futures.ProcessPoolExecutor(
+                options["workers"], initializer=django.setup
+            )
         try:
-            second_last_scraper_run = ScraperRun.objects.prefetch_related(
-                "appointments"
-            ).order_by("-start_time")[1]
-            second_last_found_appointments = set(
-                second_last_scraper_run.appointments.filter(*APPOINTMENT_TIME_FILTER)
-                .values_list(
-                    "start_time",
-                    "end_time",
-                    "date",
-                    "appointment_type",
-                    "location__name",
-                    named=True,
+            # the emails are rendered and written to the outbox in batches, so that the memory does not grow with the amount of notifications
+            block_cache = {}
+            notification_ids = sorted(notification_ids)
+            for i in range(0, len(notification_ids), DISPATCH_BATCH_SIZE):
+                self._dispatch(
+                    notification_ids[i : i + DISPATCH_BATCH_SIZE],
+                    appointments_by_last_notified_run,
+                    last_scraper_run,
+                    protocol,
+                    block_cache,
+                    executor,
+                    not options.get("no_update", False),
                 )
-                .distinct()
-            )
-        except ScraperRun.DoesNotExist:
-            second_last_found_appointments = set()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if not options["enqueue_only"]:
+            deliver_outbox()
 
-        new_appointments = last_found_appointments - second_last_found_appointments
+    def _dispatch(
+        self,
+        notification_ids: list[int],
+        appointments_by_last_notified_run: dict[int | None, set[AppointmentTuple]],
+        last_scraper_run: ScraperRun,
+        protocol: str,
+        block_cache: dict,
+        executor: concurrent.futures.Executor | None,
+        update: bool,
+    ):
+        notifications = Notification.objects.filter(
+            pk__in=notification_ids
+        ).prefetch_related(
+            Prefetch(
+                "appointment_type",
+                queryset=AppointmentType.objects.select_related("appointment_category"),
+            )
+        )
 
+        email_payloads = []
+        sent_notifications = []
         for notification in notifications:
-            email_message = create_notification_email_message_for_new_appointments(
+            new_appointments = appointments_by_last_notified_run.get(
+                notification.last_notified_run_id
+            )
+            if not new_appointments:
+                continue
+            email_payload = create_notification_email_payload_for_new_appointments(
                 notification,
-                last_scraper_run,
-                last_found_appointments,
                 new_appointments,
                 protocol,
+                block_cache,
             )
-            if email_message is None:
+            if email_payload is None:
                 continue
 
-            email_messages.append(email_message)
+            email_payloads.append(email_payload)
             sent_notifications.append(notification)
             notification.last_sent = timezone.now()
+            notification.last_notified_run = last_scraper_run
 
-        connection = mail.get_connection()
-        connection.send_messages(email_messages)
+        email_messages = render_notification_emails(email_payloads, executor)
 
-        if not options.get("no_update", False):
-            Notification.objects.bulk_update(sent_notifications, ["last_sent"])
+        # the emails are only sent once, because they are written together with the last sent scraper run
+        with transaction.atomic():
+            OutboxMessage.objects.bulk_create(
+                [
+                    create_outbox_message(email_message, notification)
+                    for email_message, notification in zip(
+                        email_messages, sent_notifications
+                    )
+                ]
+            )
+            if update:
+                Notification.objects.bulk_update(
+                    sent_notifications, ["last_sent", "last_notified_run"]
+                )
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0024_remove_appointment_creation_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResponseFingerprint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("digest", models.CharField(max_length=64, verbose_name="Prüfsumme")),
+                (
+                    "appointment_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="response_fingerprints",
+                        to="darmstadt_termine.appointmenttype",
+                        verbose_name="Anliegen",
+                    ),
+                ),
+                (
+                    "location",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="response_fingerprints",
+                        to="darmstadt_termine.location",
+                        verbose_name="Ort",
+                    ),
+                ),
+                (
+                    "scraper_run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="response_fingerprints",
+                        to="darmstadt_termine.scraperrun",
+                        verbose_name="Scraperlauf",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Antwortprüfsumme",
+                "verbose_name_plural": "Antwortprüfsummen",
+                "unique_together": {("appointment_type", "location")},
+            },
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0025_responsefingerprint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Availability",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "appointment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="availabilities",
+                        to="darmstadt_termine.appointment",
+                        verbose_name="Termin",
+                    ),
+                ),
+                (
+                    "first_seen_run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="first_seen_availabilities",
+                        to="darmstadt_termine.scraperrun",
+                        verbose_name="Zuerst gefunden",
+                    ),
+                ),
+                (
+                    "last_seen_run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="last_seen_availabilities",
+                        to="darmstadt_termine.scraperrun",
+                        verbose_name="Zuletzt gefunden",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Verfügbarkeit",
+                "verbose_name_plural": "Verfügbarkeiten",
+            },
+        ),
+    ]
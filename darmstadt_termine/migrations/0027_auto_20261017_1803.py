@@ -0,0 +1,88 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:03
+
+import bisect
+
+from django.db import migrations
+
+BATCH_SIZE = 5000
+
+
+def create_availabilities(apps, schema_editor):
+    ScraperRun = apps.get_model("darmstadt_termine", "ScraperRun")
+    Appointment = apps.get_model("darmstadt_termine", "Appointment")
+    Availability = apps.get_model("darmstadt_termine", "Availability")
+    ThroughModel = Appointment.scraper_run.through
+
+    run_ids = list(ScraperRun.objects.order_by("pk").values_list("pk", flat=True))
+    next_run_ids = dict(zip(run_ids, run_ids[1:]))
+
+    availabilities = []
+    current = None
+    for appointment_id, scraper_run_id in (
+        ThroughModel.objects.order_by("appointment_id", "scraperrun_id")
+        .values_list("appointment_id", "scraperrun_id")
+        .iterator(chunk_size=BATCH_SIZE)
+    ):
+        if (
+            current is not None
+            and current.appointment_id == appointment_id
+            and next_run_ids.get(current.last_seen_run_id) == scraper_run_id
+        ):
+            current.last_seen_run_id = scraper_run_id
+            continue
+
+        if current is not None:
+            availabilities.append(current)
+        current = Availability(
+            appointment_id=appointment_id,
+            first_seen_run_id=scraper_run_id,
+            last_seen_run_id=scraper_run_id,
+        )
+        if len(availabilities) >= BATCH_SIZE:
+            Availability.objects.bulk_create(availabilities)
+            availabilities = []
+
+    if current is not None:
+        availabilities.append(current)
+    Availability.objects.bulk_create(availabilities)
+
+
+def create_availabilities_reverse(apps, schema_editor):
+    ScraperRun = apps.get_model("darmstadt_termine", "ScraperRun")
+    Appointment = apps.get_model("darmstadt_termine", "Appointment")
+    Availability = apps.get_model("darmstadt_termine", "Availability")
+    ThroughModel = Appointment.scraper_run.through
+
+    run_ids = list(ScraperRun.objects.order_by("pk").values_list("pk", flat=True))
+
+    through_objects = []
+    for appointment_id, first_seen_run_id, last_seen_run_id in (
+        Availability.objects.order_by("pk")
+        .values_list("appointment_id", "first_seen_run_id", "last_seen_run_id")
+        .iterator(chunk_size=BATCH_SIZE)
+    ):
+        for scraper_run_id in run_ids[
+            bisect.bisect_left(run_ids, first_seen_run_id) : bisect.bisect_right(
+                run_ids, last_seen_run_id
+            )
+        ]:
+            through_objects.append(
+                ThroughModel(
+                    appointment_id=appointment_id, scraperrun_id=scraper_run_id
+                )
+            )
+        if len(through_objects) >= BATCH_SIZE:
+            ThroughModel.objects.bulk_create(through_objects)
+            through_objects = []
+    ThroughModel.objects.bulk_create(through_objects)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0026_availability"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_availabilities, create_availabilities_reverse),
+    ]
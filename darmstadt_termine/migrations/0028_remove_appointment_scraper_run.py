@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:03
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0027_auto_20261017_1803"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="appointment",
+            name="scraper_run",
+        ),
+    ]
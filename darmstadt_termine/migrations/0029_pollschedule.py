@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0028_remove_appointment_scraper_run"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PollSchedule",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("interval", models.DurationField(verbose_name="Abfrageintervall")),
+                ("next_poll", models.DateTimeField(verbose_name="Nächste Abfrage")),
+                (
+                    "last_change",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Letzte Änderung"
+                    ),
+                ),
+                (
+                    "appointment_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="poll_schedules",
+                        to="darmstadt_termine.appointmenttype",
+                        verbose_name="Anliegen",
+                    ),
+                ),
+                (
+                    "location",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="poll_schedules",
+                        to="darmstadt_termine.location",
+                        verbose_name="Ort",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Abfrageplan",
+                "verbose_name_plural": "Abfragepläne",
+                "unique_together": {("appointment_type", "location")},
+            },
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:14
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0029_pollschedule"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scraperrun",
+            name="bytes_fetched",
+            field=models.PositiveBigIntegerField(
+                default=0, verbose_name="Abgerufene Bytes"
+            ),
+        ),
+        migrations.AddField(
+            model_name="scraperrun",
+            name="db_time",
+            field=models.DurationField(
+                default=datetime.timedelta(0), verbose_name="Datenbank-Dauer"
+            ),
+        ),
+        migrations.AddField(
+            model_name="scraperrun",
+            name="errors",
+            field=models.PositiveIntegerField(default=0, verbose_name="Fehler"),
+        ),
+        migrations.AddField(
+            model_name="scraperrun",
+            name="http_time",
+            field=models.DurationField(
+                default=datetime.timedelta(0), verbose_name="HTTP-Dauer"
+            ),
+        ),
+        migrations.AddField(
+            model_name="scraperrun",
+            name="parse_time",
+            field=models.DurationField(
+                default=datetime.timedelta(0), verbose_name="Parse-Dauer"
+            ),
+        ),
+        migrations.AddField(
+            model_name="scraperrun",
+            name="requests",
+            field=models.PositiveIntegerField(default=0, verbose_name="Anfragen"),
+        ),
+        migrations.AddField(
+            model_name="scraperrun",
+            name="retries",
+            field=models.PositiveIntegerField(default=0, verbose_name="Wiederholungen"),
+        ),
+        migrations.AddField(
+            model_name="scraperrun",
+            name="slots_new",
+            field=models.PositiveIntegerField(default=0, verbose_name="Neue Termine"),
+        ),
+        migrations.AddField(
+            model_name="scraperrun",
+            name="slots_removed",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Entfernte Termine"
+            ),
+        ),
+        migrations.AddField(
+            model_name="scraperrun",
+            name="slots_seen",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="Gefundene Termine"
+            ),
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def create_appointment_changes(apps, schema_editor):
+    Availability = apps.get_model("darmstadt_termine", "Availability")
+    AppointmentChange = apps.get_model("darmstadt_termine", "AppointmentChange")
+    ScraperRun = apps.get_model("darmstadt_termine", "ScraperRun")
+    # the changes of the existing history are derived from the availabilities,
+    # an appointment was added in the first scraper run of an availability and removed in the scraper run after its last one
+    next_run = (
+        ScraperRun.objects.filter(pk__gt=models.OuterRef("last_seen_run"))
+        .order_by("pk")
+        .values("pk")[:1]
+    )
+    availabilities = (
+        Availability.objects.annotate(removed_run=models.Subquery(next_run))
+        .order_by("pk")
+        .values_list("appointment_id", "first_seen_run_id", "removed_run")
+    )
+    changes = []
+    for appointment_id, first_seen_run_id, removed_run_id in availabilities.iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        changes.append(
+            AppointmentChange(
+                appointment_id=appointment_id,
+                scraper_run_id=first_seen_run_id,
+                added=True,
+            )
+        )
+        if removed_run_id is not None:
+            changes.append(
+                AppointmentChange(
+                    appointment_id=appointment_id,
+                    scraper_run_id=removed_run_id,
+                    added=False,
+                )
+            )
+        if len(changes) >= BATCH_SIZE:
+            AppointmentChange.objects.bulk_create(changes)
+            changes = []
+    AppointmentChange.objects.bulk_create(changes)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "darmstadt_termine",
+            "0030_scraperrun_bytes_fetched_scraperrun_db_time_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AppointmentChange",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "added",
+                    models.BooleanField(
+                        help_text="Ob der Termin hinzugekommen oder weggefallen ist.",
+                        verbose_name="Hinzugefügt",
+                    ),
+                ),
+                (
+                    "appointment",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="changes",
+                        to="darmstadt_termine.appointment",
+                        verbose_name="Termin",
+                    ),
+                ),
+                (
+                    "scraper_run",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="appointment_changes",
+                        to="darmstadt_termine.scraperrun",
+                        verbose_name="Scraperlauf",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Terminänderung",
+                "verbose_name_plural": "Terminänderungen",
+                "indexes": [
+                    models.Index(
+                        fields=["scraper_run", "added"],
+                        name="darmstadt_t_scraper_846779_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(create_appointment_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0031_appointmentchange"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyAvailability",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="Tag")),
+                (
+                    "appointments",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Verfügbare Termine"
+                    ),
+                ),
+                (
+                    "appointments_added",
+                    models.PositiveIntegerField(default=0, verbose_name="Neue Termine"),
+                ),
+                (
+                    "appointments_removed",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Entfernte Termine"
+                    ),
+                ),
+                (
+                    "appointment_type",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_availabilities",
+                        to="darmstadt_termine.appointmenttype",
+                        verbose_name="Termintyp",
+                    ),
+                ),
+                (
+                    "location",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_availabilities",
+                        to="darmstadt_termine.location",
+                        verbose_name="Ort",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Tägliche Verfügbarkeit",
+                "verbose_name_plural": "Tägliche Verfügbarkeiten",
+                "unique_together": {("day", "appointment_type", "location")},
+            },
+        ),
+    ]
@@ -0,0 +1,154 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:28
+
+import bisect
+import functools
+import operator
+
+from django.db import migrations, models, transaction
+
+NATURAL_KEY = ("appointment_type", "location", "date", "start_time", "end_time")
+BATCH_SIZE = 500
+
+
+def delete_duplicate_rows(model, fields, appointment_ids):
+    rows = model.objects.filter(appointment_id__in=appointment_ids)
+    rows.exclude(
+        pk__in=rows.values(*fields).annotate(kept_id=models.Min("pk")).values("kept_id")
+    ).delete()
+
+
+def merge_availabilities(Availability, AppointmentChange, run_ids, appointment_ids):
+    # overlapping or adjacent intervals of an appointment are merged into one,
+    # an interval is adjacent if it starts at the scraper run following the end of the previous one
+    def next_run_id(run_id):
+        index = bisect.bisect_right(run_ids, run_id)
+        return run_ids[index] if index < len(run_ids) else run_id + 1
+
+    merged = []
+    merged_away = []
+    current = None
+    for availability in Availability.objects.filter(
+        appointment_id__in=appointment_ids
+    ).order_by("appointment_id", "first_seen_run_id", "last_seen_run_id"):
+        if (
+            current is not None
+            and availability.appointment_id == current.appointment_id
+            and availability.first_seen_run_id <= next_run_id(current.last_seen_run_id)
+        ):
+            current.last_seen_run_id = max(
+                current.last_seen_run_id, availability.last_seen_run_id
+            )
+            merged_away.append(availability.pk)
+            if not merged or merged[-1] is not current:
+                merged.append(current)
+            continue
+        current = availability
+
+    if not merged:
+        return
+    Availability.objects.bulk_update(merged, ["last_seen_run"], batch_size=BATCH_SIZE)
+    Availability.objects.filter(pk__in=merged_away).delete()
+    # the appointment was available during the whole merged interval, so it was neither added nor removed within it
+    for i in range(0, len(merged), BATCH_SIZE):
+        AppointmentChange.objects.filter(
+            functools.reduce(
+                operator.or_,
+                (
+                    models.Q(
+                        appointment_id=availability.appointment_id,
+                        scraper_run_id__gt=availability.first_seen_run_id,
+                        scraper_run_id__lte=availability.last_seen_run_id,
+                    )
+                    for availability in merged[i : i + BATCH_SIZE]
+                ),
+            )
+        ).delete()
+
+
+def deduplicate_appointments(apps, schema_editor):
+    Appointment = apps.get_model("darmstadt_termine", "Appointment")
+    Availability = apps.get_model("darmstadt_termine", "Availability")
+    AppointmentChange = apps.get_model("darmstadt_termine", "AppointmentChange")
+    ScraperRun = apps.get_model("darmstadt_termine", "ScraperRun")
+
+    # appointments without location are never equal in the unique constraint
+    duplicate_groups = list(
+        Appointment.objects.filter(location__isnull=False)
+        .values(*NATURAL_KEY)
+        .annotate(kept_id=models.Min("pk"), count=models.Count("pk"))
+        .filter(count__gt=1)
+        .order_by()
+    )
+    if not duplicate_groups:
+        return
+    run_ids = list(ScraperRun.objects.order_by("pk").values_list("pk", flat=True))
+    for i in range(0, len(duplicate_groups), BATCH_SIZE):
+        groups = duplicate_groups[i : i + BATCH_SIZE]
+        kept_ids = {
+            tuple(group[field] for field in NATURAL_KEY): group["kept_id"]
+            for group in groups
+        }
+        duplicates = Appointment.objects.filter(
+            functools.reduce(
+                operator.or_,
+                (
+                    models.Q(**{field: group[field] for field in NATURAL_KEY})
+                    for group in groups
+                ),
+            )
+        ).exclude(pk__in=kept_ids.values())
+        kept_id_by_duplicate = {}
+        for pk, *natural_key in duplicates.values_list("pk", *NATURAL_KEY):
+            kept_id_by_duplicate[pk] = kept_ids[tuple(natural_key)]
+        if not kept_id_by_duplicate:
+            continue
+
+        # the history of the duplicates is moved to the kept appointment with a single update per table
+        kept_appointment = models.Case(
+            *(
+                models.When(appointment_id=duplicate_id, then=models.Value(kept_id))
+                for duplicate_id, kept_id in kept_id_by_duplicate.items()
+            )
+        )
+        with transaction.atomic():
+            Availability.objects.filter(
+                appointment_id__in=kept_id_by_duplicate.keys()
+            ).update(appointment_id=kept_appointment)
+            AppointmentChange.objects.filter(
+                appointment_id__in=kept_id_by_duplicate.keys()
+            ).update(appointment_id=kept_appointment)
+            merge_availabilities(
+                Availability, AppointmentChange, run_ids, kept_ids.values()
+            )
+            delete_duplicate_rows(
+                AppointmentChange,
+                ("appointment", "scraper_run", "added"),
+                kept_ids.values(),
+            )
+            Appointment.objects.filter(pk__in=kept_id_by_duplicate.keys()).delete()
+
+
+class Migration(migrations.Migration):
+    # every batch of duplicates is committed on its own, so that the tables are not locked during the whole migration
+    atomic = False
+
+    dependencies = [
+        ("darmstadt_termine", "0032_dailyavailability"),
+    ]
+
+    operations = [
+        migrations.RunPython(deduplicate_appointments, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="appointment",
+            constraint=models.UniqueConstraint(
+                fields=(
+                    "appointment_type",
+                    "location",
+                    "date",
+                    "start_time",
+                    "end_time",
+                ),
+                name="unique_appointment",
+            ),
+        ),
+    ]
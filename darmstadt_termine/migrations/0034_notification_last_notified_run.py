@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def set_last_notified_run(apps, schema_editor):
+    Notification = apps.get_model("darmstadt_termine", "Notification")
+    ScraperRun = apps.get_model("darmstadt_termine", "ScraperRun")
+    # the last scraper run which ended before the notification was sent
+    Notification.objects.update(
+        last_notified_run=models.Subquery(
+            ScraperRun.objects.filter(end_time__lt=models.OuterRef("last_sent"))
+            .order_by("-start_time")
+            .values("pk")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0033_appointment_unique_appointment"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="notification",
+            name="last_notified_run",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Der Scraperlauf, dessen Termine zuletzt gesendet wurden. Es werden nur Termine gesendet, die seitdem hinzugekommen sind.",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="notifications",
+                to="darmstadt_termine.scraperrun",
+                verbose_name="Zuletzt benachrichtigter Scraperlauf",
+            ),
+        ),
+        migrations.RunPython(set_last_notified_run, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0034_notification_last_notified_run"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("email", models.EmailField(max_length=254, verbose_name="E-Mail")),
+                ("subject", models.CharField(max_length=998, verbose_name="Betreff")),
+                ("body", models.TextField(verbose_name="Text")),
+                ("html_body", models.TextField(blank=True, verbose_name="HTML")),
+                (
+                    "creation_date",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Erstellungsdatum"
+                    ),
+                ),
+                (
+                    "sent",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Gesendet"
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="Versuche"),
+                ),
+                (
+                    "next_attempt",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Nächster Versuch",
+                    ),
+                ),
+                (
+                    "last_error",
+                    models.TextField(blank=True, verbose_name="Letzter Fehler"),
+                ),
+                (
+                    "notification",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="outbox_messages",
+                        to="darmstadt_termine.notification",
+                        verbose_name="Benachrichtigung",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Ausgehende E-Mail",
+                "verbose_name_plural": "Ausgehende E-Mails",
+                "indexes": [
+                    models.Index(
+                        fields=["sent", "next_attempt"],
+                        name="darmstadt_t_sent_14e1ba_idx",
+                    )
+                ],
+            },
+        ),
+    ]
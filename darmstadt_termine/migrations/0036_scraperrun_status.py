@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:49
+
+from django.db import migrations, models
+
+
+def complete_scraper_runs(apps, schema_editor):
+    ScraperRun = apps.get_model("darmstadt_termine", "ScraperRun")
+    # the scraper runs before the status was stored are treated as completed like before
+    ScraperRun.objects.update(status="completed")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0035_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scraperrun",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("running", "Läuft"),
+                    ("completed", "Abgeschlossen"),
+                    ("failed", "Fehlgeschlagen"),
+                ],
+                default="running",
+                max_length=9,
+                verbose_name="Status",
+            ),
+        ),
+        migrations.RunPython(complete_scraper_runs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="scraperrun",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("status", "running")),
+                fields=("status",),
+                name="single_running_scraper_run",
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:51
+
+import datetime
+
+from django.db import migrations, models
+from django.db.models import functions
+import django.db.models.deletion
+
+# the default of last_sent, notifications with it were never sent
+NEVER_SENT = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def set_missing_last_notified_run(apps, schema_editor):
+    Notification = apps.get_model("darmstadt_termine", "Notification")
+    ScraperRun = apps.get_model("darmstadt_termine", "ScraperRun")
+    # notifications which were sent lost their last notified scraper run, when it was deleted.
+    # It is replaced by the last scraper run which ended before the notification was sent or the first scraper run left.
+    Notification.objects.filter(last_notified_run__isnull=True).exclude(
+        last_sent=NEVER_SENT
+    ).update(
+        last_notified_run=functions.Coalesce(
+            models.Subquery(
+                ScraperRun.objects.filter(end_time__lt=models.OuterRef("last_sent"))
+                .order_by("-start_time")
+                .values("pk")[:1]
+            ),
+            models.Subquery(ScraperRun.objects.order_by("start_time").values("pk")[:1]),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0036_scraperrun_status"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="notification",
+            name="last_notified_run",
+            field=models.ForeignKey(
+                blank=True,
+                help_text="Der Scraperlauf, dessen Termine zuletzt gesendet wurden. Es werden nur Termine gesendet, die seitdem hinzugekommen sind.",
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="notifications",
+                to="darmstadt_termine.scraperrun",
+                verbose_name="Zuletzt benachrichtigter Scraperlauf",
+            ),
+        ),
+        migrations.RunPython(set_missing_last_notified_run, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def delete_orphaned_outbox_messages(apps, schema_editor):
+    OutboxMessage = apps.get_model("darmstadt_termine", "OutboxMessage")
+    # the emails of deleted notifications are deleted with them from now on
+    OutboxMessage.objects.filter(notification__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("darmstadt_termine", "0037_alter_notification_last_notified_run"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="outboxmessage",
+            name="claim",
+            field=models.CharField(
+                blank=True, max_length=32, verbose_name="Reservierung"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="outboxmessage",
+            name="notification",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="outbox_messages",
+                to="darmstadt_termine.notification",
+                verbose_name="Benachrichtigung",
+            ),
+        ),
+        migrations.RunPython(
+            delete_orphaned_outbox_messages, migrations.RunPython.noop
+        ),
+    ]
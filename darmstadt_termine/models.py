@@ -2,20 +2,16 @@ import datetime
 
 from django.core import validators
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
 class Appointment(models.Model):
     """
     Appointment stores the start and end times for a appointment. Also stores the corresponding :model:`darmstadt_termine.AppointmentType`.
-    This is a many to many relation in order to group multiple appointment types with the same timeframe together.
+    In which :model:`darmstadt_termine.ScraperRun`s the appointment was available is stored in :model:`darmstadt_termine.Availability`.
     """
 
-    scraper_run = models.ManyToManyField(
-        "ScraperRun",
-        verbose_name=_("Scraperläufe"),
-        related_name="appointments",
-    )
     start_time = models.TimeField(verbose_name=_("Startzeit"))
     end_time = models.TimeField(verbose_name=_("Endzeit"))
     date = models.DateField(verbose_name=_("Datum"))
@@ -34,7 +30,18 @@ class Appointment(models.Model):
     )
 
     class Meta:
-        # unique_together = ["start_time", "end_time", "date", "creation_date"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    "appointment_type",
+                    "location",
+                    "date",
+                    "start_time",
+                    "end_time",
+                ],
+                name="unique_appointment",
+            )
+        ]
         verbose_name = _("Termin")
         verbose_name_plural = _("Termine")
 
@@ -42,6 +49,110 @@ class Appointment(models.Model):
         return f"{self.date} {self.start_time}-{self.end_time}"
 
 
+class Availability(models.Model):
+    """
+    Availability stores an uninterrupted interval of :model:`darmstadt_termine.ScraperRun`s in which an :model:`darmstadt_termine.Appointment` was available.
+    The interval includes first_seen_run and last_seen_run, if last_seen_run is the latest scraper run the appointment is still available.
+    Scraper runs are ordered by their id, because they run one after another.
+    """
+
+    appointment = models.ForeignKey(
+        "Appointment",
+        verbose_name=_("Termin"),
+        on_delete=models.CASCADE,
+        related_name="availabilities",
+    )
+    first_seen_run = models.ForeignKey(
+        "ScraperRun",
+        verbose_name=_("Zuerst gefunden"),
+        on_delete=models.CASCADE,
+        related_name="first_seen_availabilities",
+    )
+    last_seen_run = models.ForeignKey(
+        "ScraperRun",
+        verbose_name=_("Zuletzt gefunden"),
+        on_delete=models.CASCADE,
+        related_name="last_seen_availabilities",
+    )
+
+    class Meta:
+        verbose_name = _("Verfügbarkeit")
+        verbose_name_plural = _("Verfügbarkeiten")
+
+    def __str__(self):
+        return f"{self.appointment}: {self.first_seen_run_id}-{self.last_seen_run_id}"
+
+
+class AppointmentChange(models.Model):
+    """
+    AppointmentChange stores that an :model:`darmstadt_termine.Appointment` became available or vanished in a :model:`darmstadt_termine.ScraperRun`.
+    The changes of a scraper run are its delta to the scraper run before, they are written by the scraper when the run is saved.
+    """
+
+    scraper_run = models.ForeignKey(
+        "ScraperRun",
+        verbose_name=_("Scraperlauf"),
+        on_delete=models.CASCADE,
+        related_name="appointment_changes",
+    )
+    appointment = models.ForeignKey(
+        "Appointment",
+        verbose_name=_("Termin"),
+        on_delete=models.CASCADE,
+        related_name="changes",
+    )
+    added = models.BooleanField(
+        _("Hinzugefügt"),
+        help_text=_("Ob der Termin hinzugekommen oder weggefallen ist."),
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=["scraper_run", "added"])]
+        verbose_name = _("Terminänderung")
+        verbose_name_plural = _("Terminänderungen")
+
+    def __str__(self):
+        return f"{self.scraper_run_id}: {'+' if self.added else '-'}{self.appointment}"
+
+
+class DailyAvailability(models.Model):
+    """
+    DailyAvailability stores how many appointments of an :model:`darmstadt_termine.AppointmentType` at a :model:`darmstadt_termine.Location`
+    were available on a day and how many of them were added or vanished that day.
+    It replaces the detailed history of old :model:`darmstadt_termine.ScraperRun`s, which is deleted by the compact_history command.
+    """
+
+    day = models.DateField(_("Tag"))
+    appointment_type = models.ForeignKey(
+        "AppointmentType",
+        verbose_name=_("Termintyp"),
+        on_delete=models.CASCADE,
+        related_name="daily_availabilities",
+    )
+    location = models.ForeignKey(
+        "Location",
+        verbose_name=_("Ort"),
+        on_delete=models.CASCADE,
+        related_name="daily_availabilities",
+        null=True,
+    )
+    appointments = models.PositiveIntegerField(_("Verfügbare Termine"), default=0)
+    appointments_added = models.PositiveIntegerField(_("Neue Termine"), default=0)
+    appointments_removed = models.PositiveIntegerField(
+        _("Entfernte Termine"), default=0
+    )
+
+    class Meta:
+        unique_together = ["day", "appointment_type", "location"]
+        verbose_name = _("Tägliche Verfügbarkeit")
+        verbose_name_plural = _("Tägliche Verfügbarkeiten")
+
+    def __str__(self):
+        return (
+            f"{self.day} {self.appointment_type} - {self.location}: {self.appointments}"
+        )
+
+
 class Notification(models.Model):
     """
     Notififcation stores an email adress and the subscribed :model:`darmstadt_termine.AppointmentType` to send notifications for.
@@ -50,6 +161,8 @@ class Notification(models.Model):
     token_verifier is a hash of a random value with which you can verify that a token is correct
 
     minimum_waitime is the minimum time to wait before sending another notification in order not to spam the user.
+    last_notified_run is the :model:`darmstadt_termine.ScraperRun` whose appointments were sent last, only appointments added after it are sent next time.
+    It is only empty if the notification was never sent, the scraper run can not be deleted while a notification references it.
     """
 
     email = models.EmailField(_("E-Mail"), max_length=254, unique=True)
@@ -76,6 +189,17 @@ class Notification(models.Model):
         auto_now_add=False,
         default=datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc),
     )
+    last_notified_run = models.ForeignKey(
+        "ScraperRun",
+        verbose_name=_("Zuletzt benachrichtigter Scraperlauf"),
+        on_delete=models.PROTECT,
+        related_name="notifications",
+        null=True,
+        blank=True,
+        help_text=_(
+            "Der Scraperlauf, dessen Termine zuletzt gesendet wurden. Es werden nur Termine gesendet, die seitdem hinzugekommen sind."
+        ),
+    )
     minimum_waittime = models.DurationField(
         _("Mindestwartezeit"),
         validators=[
@@ -100,6 +224,42 @@ class Notification(models.Model):
         return self.email
 
 
+class OutboxMessage(models.Model):
+    """
+    OutboxMessage stores an email of a :model:`darmstadt_termine.Notification` until it is delivered by the process_outbox command.
+    It is written in the same transaction as the last_sent timestamp of the notification, so that every email is sent once even if sending is interrupted.
+    Failed deliveries are retried at next_attempt until the maximum amount of attempts is reached.
+    A delivering process claims the email with its claim and moves next_attempt to when the claim expires.
+    """
+
+    notification = models.ForeignKey(
+        "Notification",
+        verbose_name=_("Benachrichtigung"),
+        on_delete=models.CASCADE,
+        related_name="outbox_messages",
+        null=True,
+        blank=True,
+    )
+    email = models.EmailField(_("E-Mail"), max_length=254)
+    subject = models.CharField(_("Betreff"), max_length=998)
+    body = models.TextField(_("Text"))
+    html_body = models.TextField(_("HTML"), blank=True)
+    creation_date = models.DateTimeField(_("Erstellungsdatum"), auto_now_add=True)
+    sent = models.DateTimeField(_("Gesendet"), null=True, blank=True)
+    attempts = models.PositiveIntegerField(_("Versuche"), default=0)
+    next_attempt = models.DateTimeField(_("Nächster Versuch"), default=timezone.now)
+    last_error = models.TextField(_("Letzter Fehler"), blank=True)
+    claim = models.CharField(_("Reservierung"), max_length=32, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["sent", "next_attempt"])]
+        verbose_name = _("Ausgehende E-Mail")
+        verbose_name_plural = _("Ausgehende E-Mails")
+
+    def __str__(self):
+        return f"{self.email}: {self.subject}"
+
+
 class AppointmentType(models.Model):
     """
     AppointmentType stores the name of a appointment type and the related :model:`darmstadt_termine.AppointmentCategory`.
@@ -159,12 +319,40 @@ class AppointmentCategory(models.Model):
 class ScraperRun(models.Model):
     """
     ScraperRun stores the start and end time of a scraper run.
+    Also stores how many requests were sent, how many appointments were found and how long the phases of the run took.
+    The phase durations are summed up over all requests, concurrent requests therefore add up to more than the run took.
+    Only completed scraper runs found all appointments, only one scraper run may be running at a time.
     """
 
+    class Status(models.TextChoices):
+        RUNNING = "running", _("Läuft")
+        COMPLETED = "completed", _("Abgeschlossen")
+        FAILED = "failed", _("Fehlgeschlagen")
+
     start_time = models.DateTimeField(_("Startzeit"), auto_now_add=True)
     end_time = models.DateTimeField(_("Endzeit"), auto_now=True)
+    requests = models.PositiveIntegerField(_("Anfragen"), default=0)
+    bytes_fetched = models.PositiveBigIntegerField(_("Abgerufene Bytes"), default=0)
+    http_time = models.DurationField(_("HTTP-Dauer"), default=datetime.timedelta(0))
+    parse_time = models.DurationField(_("Parse-Dauer"), default=datetime.timedelta(0))
+    db_time = models.DurationField(_("Datenbank-Dauer"), default=datetime.timedelta(0))
+    slots_seen = models.PositiveIntegerField(_("Gefundene Termine"), default=0)
+    slots_new = models.PositiveIntegerField(_("Neue Termine"), default=0)
+    slots_removed = models.PositiveIntegerField(_("Entfernte Termine"), default=0)
+    retries = models.PositiveIntegerField(_("Wiederholungen"), default=0)
+    errors = models.PositiveIntegerField(_("Fehler"), default=0)
+    status = models.CharField(
+        _("Status"), max_length=9, choices=Status.choices, default=Status.RUNNING
+    )
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["status"],
+                condition=models.Q(status="running"),
+                name="single_running_scraper_run",
+            )
+        ]
         verbose_name = _("Scraperlauf")
         verbose_name_plural = _("Scraperläufe")
 
@@ -172,6 +360,74 @@ class ScraperRun(models.Model):
         return f"{self.start_time} - {self.end_time}"
 
 
+class ResponseFingerprint(models.Model):
+    """
+    ResponseFingerprint stores a hash of the last normalized tevis response for an :model:`darmstadt_termine.AppointmentType` at a :model:`darmstadt_termine.Location`.
+    It also stores the :model:`darmstadt_termine.ScraperRun` which received the response.
+    If the next scraper run receives the same response, it can reuse the appointments of that run instead of parsing the response again.
+    """
+
+    appointment_type = models.ForeignKey(
+        "AppointmentType",
+        verbose_name=_("Anliegen"),
+        on_delete=models.CASCADE,
+        related_name="response_fingerprints",
+    )
+    location = models.ForeignKey(
+        "Location",
+        verbose_name=_("Ort"),
+        on_delete=models.CASCADE,
+        related_name="response_fingerprints",
+    )
+    scraper_run = models.ForeignKey(
+        "ScraperRun",
+        verbose_name=_("Scraperlauf"),
+        on_delete=models.CASCADE,
+        related_name="response_fingerprints",
+    )
+    digest = models.CharField(_("Prüfsumme"), max_length=64)
+
+    class Meta:
+        unique_together = ["appointment_type", "location"]
+        verbose_name = _("Antwortprüfsumme")
+        verbose_name_plural = _("Antwortprüfsummen")
+
+    def __str__(self):
+        return f"{self.appointment_type} - {self.location}: {self.digest}"
+
+
+class PollSchedule(models.Model):
+    """
+    PollSchedule stores how often the scraper requests the appointments of an :model:`darmstadt_termine.AppointmentType` at a :model:`darmstadt_termine.Location`.
+    The interval shrinks when the response changed since the last request and grows when it did not change.
+    next_poll is the time after which the scraper requests the appointments again.
+    """
+
+    appointment_type = models.ForeignKey(
+        "AppointmentType",
+        verbose_name=_("Anliegen"),
+        on_delete=models.CASCADE,
+        related_name="poll_schedules",
+    )
+    location = models.ForeignKey(
+        "Location",
+        verbose_name=_("Ort"),
+        on_delete=models.CASCADE,
+        related_name="poll_schedules",
+    )
+    interval = models.DurationField(_("Abfrageintervall"))
+    next_poll = models.DateTimeField(_("Nächste Abfrage"))
+    last_change = models.DateTimeField(_("Letzte Änderung"), null=True, blank=True)
+
+    class Meta:
+        unique_together = ["appointment_type", "location"]
+        verbose_name = _("Abfrageplan")
+        verbose_name_plural = _("Abfragepläne")
+
+    def __str__(self):
+        return f"{self.appointment_type} - {self.location}: {self.interval}"
+
+
 class Location(models.Model):
     """
     Location stores the name, descriptor and id of a location where appointments can be made.
@@ -0,0 +1,316 @@
+import datetime
+import functools
+import hashlib
+import re
+from typing import NamedTuple
+
+from bs4 import BeautifulSoup, SoupStrainer
+from lxml import etree
+
+# all forms and inputs are kept, because the inputs of a suggestion form may follow it outside of it
+forms_and_inputs = SoupStrainer(["form", "input"])
+
+html_parser = etree.HTMLParser()
+find_time_forms = etree.XPath(
+    "//form[contains(concat(' ', normalize-space(@class), ' '), ' suggestion_form ')]"
+)
+# the first matching input inside or after the form, like BeautifulSoups findNext
+find_input_value = etree.XPath(
+    "(.//input[@name = $name] | following::input[@name = $name])[1]/@value",
+    smart_strings=False,
+)
+find_input = etree.XPath(
+    "(.//input[@name = $name] | following::input[@name = $name])[1]"
+)
+
+
+whitespace = re.compile(rb"\s+")
+
+
+class ParsedAppointment(NamedTuple):
+    start_time: datetime.time
+    end_time: datetime.time
+    date: datetime.date
+
+
+class ParseResult(NamedTuple):
+    appointments: list[ParsedAppointment]
+    invalid_elements: list[str]
+
+
+@functools.lru_cache(maxsize=2048)
+def minutes_to_time(minutes: int) -> datetime.time:
+    return datetime.time(hour=minutes // 60, minute=minutes % 60)
+
+
+@functools.lru_cache(maxsize=2048)
+def parse_date(value: str) -> datetime.date:
+    """
+    parse_date parses a date in the format YYYYMMDD
+    """
+    if len(value) != 8:
+        raise ValueError(f"Invalid date: {value}")
+    return datetime.date(int(value[:4]), int(value[4:6]), int(value[6:]))
+
+
+def parse_appointments_lxml(content: bytes) -> ParseResult:
+    """
+    parse_appointments_lxml extracts the appointments from a tevis result page using compiled XPath expressions
+
+    Args:
+        content (bytes): the raw response body
+
+    Returns:
+        ParseResult: the parsed appointments and the elements which could not be parsed
+    """
+    appointments = []
+    invalid_elements = []
+    root = etree.fromstring(content, html_parser)
+    if root is None:
+        return ParseResult(appointments, invalid_elements)
+
+    for element in find_time_forms(root):
+        try:
+            start_time = int(find_input_value(element, name="start")[0])  # in minutes
+            end_time = int(find_input_value(element, name="end")[0])  # in minutes
+            date = find_input_value(element, name="date")[0]  # format YYYYMMDD
+            appointments.append(
+                ParsedAppointment(
+                    minutes_to_time(start_time),
+                    minutes_to_time(end_time),
+                    parse_date(date),
+                )
+            )
+        except (IndexError, ValueError):
+            invalid_elements.append(etree.tostring(element, encoding="unicode"))
+    return ParseResult(appointments, invalid_elements)
+
+
+def parse_appointments_soup(content: bytes) -> ParseResult:
+    """
+    parse_appointments_soup extracts the appointments from a tevis result page using BeautifulSoup.
+    Inputs are looked up like in parse_appointments_lxml, inside the form or after it.
+
+    Args:
+        content (bytes): the raw response body
+
+    Returns:
+        ParseResult: the parsed appointments and the elements which could not be parsed
+    """
+    appointments = []
+    invalid_elements = []
+    soup = BeautifulSoup(content, "lxml", parse_only=forms_and_inputs)
+
+    for element in soup.find_all("form", class_="suggestion_form"):
+        try:
+            start_time = int(
+                element.findNext("input", attrs={"name": "start"})["value"]
+            )  # in minutes
+            end_time = int(
+                element.findNext("input", attrs={"name": "end"})["value"]
+            )  # in minutes
+            date: str = element.findNext("input", attrs={"name": "date"})[
+                "value"
+            ]  # format YYYYMMDD
+            appointments.append(
+                ParsedAppointment(
+                    minutes_to_time(start_time),
+                    minutes_to_time(end_time),
+                    datetime.datetime.strptime(date, "%Y%m%d").date(),
+                )
+            )
+        except (KeyError, TypeError, ValueError):
+            invalid_elements.append(str(element))
+    return ParseResult(appointments, invalid_elements)
+
+
+def parse_appointments(content: bytes) -> ParseResult:
+    """
+    parse_appointments extracts the appointments from a tevis result page.
+    Uses lxml directly and falls back to BeautifulSoup if lxml can not handle the page.
+
+    Args:
+        content (bytes): the raw response body
+
+    Returns:
+        ParseResult: the parsed appointments and the elements which could not be parsed
+    """
+    try:
+        return parse_appointments_lxml(content)
+    except (etree.LxmlError, ValueError):
+        return parse_appointments_soup(content)
+
+
+class AppointmentStreamParser:
+    """
+    AppointmentStreamParser extracts the appointments from a tevis result page while it is received.
+    An appointment is parsed as soon as its suggestion form and its inputs are complete,
+    afterwards the form and everything before it is removed from the tree, so that the page is never held in memory as a whole.
+    Inputs are looked up like in parse_appointments_lxml, inside the form or after it.
+    """
+
+    input_names = ("start", "end", "date")
+
+    def __init__(self) -> None:
+        self.appointments: list[ParsedAppointment] = []
+        self.invalid_elements: list[str] = []
+        self._parser = etree.HTMLPullParser(events=("end",), tag=("form", "input"))
+        # forms whose inputs are not complete yet with the values found so far
+        self._pending_forms: list[tuple[etree._Element, dict[str, str]]] = []
+
+    def _parse_form(self, element: etree._Element, values: dict[str, str]):
+        try:
+            self.appointments.append(
+                ParsedAppointment(
+                    minutes_to_time(int(values["start"])),  # in minutes
+                    minutes_to_time(int(values["end"])),  # in minutes
+                    parse_date(values["date"]),  # format YYYYMMDD
+                )
+            )
+        except (TypeError, ValueError):
+            self.invalid_elements.append(etree.tostring(element, encoding="unicode"))
+
+    def _handle_input(self, element: etree._Element):
+        name = element.get("name")
+        if name not in self.input_names:
+            return
+        pending_forms = []
+        for form, values in self._pending_forms:
+            values.setdefault(name, element.get("value"))
+            if len(values) == len(self.input_names):
+                self._parse_form(form, values)
+            else:
+                pending_forms.append((form, values))
+        self._pending_forms = pending_forms
+
+    def _handle_form(self, element: etree._Element):
+        if "suggestion_form" not in (element.get("class") or "").split():
+            return
+        values = {}
+        for name in self.input_names:
+            # an input without value makes the form invalid like in parse_appointments_lxml
+            found_inputs = find_input(element, name=name)
+            if found_inputs:
+                values[name] = found_inputs[0].get("value")
+        if len(values) == len(self.input_names):
+            self._parse_form(element, values)
+        else:
+            self._pending_forms.append((element, values))
+            return
+
+        element.clear(keep_tail=True)
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+    def _read_events(self):
+        for _, element in self._parser.read_events():
+            if element.tag == "input":
+                if self._pending_forms:
+                    self._handle_input(element)
+            else:
+                self._handle_form(element)
+
+    def feed(self, chunk: bytes):
+        """
+        feed parses the next chunk of the page
+
+        Args:
+            chunk (bytes): the next chunk of the raw response body
+        """
+        self._parser.feed(chunk)
+        self._read_events()
+
+    def close(self) -> ParseResult:
+        """
+        close finishes parsing the page
+
+        Returns:
+            ParseResult: the parsed appointments and the elements which could not be parsed
+        """
+        try:
+            self._parser.close()
+        except etree.LxmlError:
+            pass  # the page is empty
+        self._read_events()
+        for form, _ in self._pending_forms:
+            self.invalid_elements.append(etree.tostring(form, encoding="unicode"))
+        self._pending_forms = []
+        return ParseResult(self.appointments, self.invalid_elements)
+
+
+@functools.lru_cache(maxsize=None)
+def compile_patterns(patterns: tuple[str, ...]) -> re.Pattern:
+    return re.compile(
+        "|".join(f"(?:{pattern})" for pattern in patterns).encode(), re.IGNORECASE
+    )
+
+
+def normalize_response(content: bytes, ignore_patterns: tuple[str, ...]) -> bytes:
+    """
+    normalize_response removes parts of a response which change with every request, such as session ids, and collapses whitespace.
+    The patterns are matched case insensitive.
+
+    Args:
+        content (bytes): the raw response body
+        ignore_patterns (tuple[str, ...]): regular expressions matching the parts to remove
+
+    Returns:
+        bytes: the normalized response body
+    """
+    if ignore_patterns:
+        content = compile_patterns(ignore_patterns).sub(b"", content)
+    return whitespace.sub(b" ", content)
+
+
+def fingerprint_response(content: bytes, ignore_patterns: tuple[str, ...]) -> str:
+    """
+    fingerprint_response hashes the normalized response
+
+    Args:
+        content (bytes): the raw response body
+        ignore_patterns (tuple[str, ...]): regular expressions matching the parts to ignore
+
+    Returns:
+        str: the hex digest of the normalized response
+    """
+    return hashlib.sha256(normalize_response(content, ignore_patterns)).hexdigest()
+
+
+def fingerprint_appointments(result: ParseResult) -> str:
+    """
+    fingerprint_appointments hashes the parsed appointments of a response independent of their order,
+    it is used instead of fingerprint_response if the response is not kept after parsing
+
+    Args:
+        result (ParseResult): the parsed appointments and the elements which could not be parsed
+
+    Returns:
+        str: the hex digest of the appointments
+    """
+    digest = hashlib.sha256()
+    for appointment in sorted(result.appointments):
+        digest.update(repr(tuple(appointment)).encode())
+    for element in sorted(result.invalid_elements):
+        digest.update(element.encode())
+    return digest.hexdigest()
+
+
+def parse_changed_response(
+    content: bytes, ignore_patterns: tuple[str, ...], previous_digest: str | None
+) -> tuple[str, ParseResult | None]:
+    """
+    parse_changed_response fingerprints a response and only parses it if the fingerprint differs from the previous one.
+    Its arguments and results can be pickled, so that it can run in a worker process.
+
+    Args:
+        content (bytes): the raw response body
+        ignore_patterns (tuple[str, ...]): regular expressions matching the parts to ignore
+        previous_digest (str | None): the fingerprint of the previous response
+
+    Returns:
+        tuple[str, ParseResult | None]: the fingerprint and the parse result, which is None if the response did not change
+    """
+    digest = fingerprint_response(content, ignore_patterns)
+    if digest == previous_digest:
+        return digest, None
+    return digest, parse_appointments(content)
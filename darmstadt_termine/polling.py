@@ -0,0 +1,75 @@
+import datetime
+from typing import Iterable
+
+# the start of scraper runs started by cron jitters a bit, which should not delay a poll by a whole run
+POLL_TOLERANCE = datetime.timedelta(seconds=5)
+
+
+def is_quiet_time(
+    value: datetime.time,
+    quiet_hours: Iterable[tuple[datetime.time, datetime.time]],
+) -> bool:
+    """
+    is_quiet_time checks whether the time lies within any of the quiet hours.
+    Quiet hours may span midnight, for example (20:00, 06:00).
+
+    Args:
+        value (datetime.time): the time to check
+        quiet_hours (Iterable[tuple[datetime.time, datetime.time]]): the start and end times of the quiet hours
+
+    Returns:
+        bool: True if the time lies within quiet hours
+    """
+    for start, end in quiet_hours:
+        if start <= end:
+            if start <= value < end:
+                return True
+        elif value >= start or value < end:
+            return True
+    return False
+
+
+def next_poll_interval(
+    interval: datetime.timedelta | None,
+    changed: bool,
+    minimum: datetime.timedelta,
+    maximum: datetime.timedelta,
+    factor: float,
+) -> datetime.timedelta:
+    """
+    next_poll_interval halves the interval if the response changed and multiplies it by factor if it did not change
+
+    Args:
+        interval (datetime.timedelta | None): the current interval, None if there is none yet
+        changed (bool): whether the response changed since the last poll
+        minimum (datetime.timedelta): the shortest allowed interval
+        maximum (datetime.timedelta): the longest allowed interval
+        factor (float): the factor the interval grows by if nothing changed
+
+    Returns:
+        datetime.timedelta: the new interval
+    """
+    if interval is None or changed:
+        interval = (interval or minimum) / 2
+    else:
+        interval = interval * factor
+    return min(maximum, max(minimum, interval))
+
+
+def is_due(
+    next_poll: datetime.datetime | None, now: datetime.datetime, quiet: bool
+) -> bool:
+    """
+    is_due checks whether a poll is due
+
+    Args:
+        next_poll (datetime.datetime | None): the time of the next poll, None if it was never polled
+        now (datetime.datetime): the current time
+        quiet (bool): whether it is quiet time
+
+    Returns:
+        bool: True if the poll is due
+    """
+    if next_poll is None:
+        return True
+    return not quiet and next_poll <= now + POLL_TOLERANCE
@@ -0,0 +1,303 @@
+import asyncio
+import base64
+import datetime
+import json
+import pathlib
+import random
+import re
+from urllib.parse import parse_qsl
+
+import httpx
+
+RECORDS_FILE = "records.jsonl"
+CHAIN_KEY_EXTENSION = "darmstadt_termine_chain_key"
+
+time_form = re.compile(
+    rb"<form[^>]*class=[\"'][^\"']*suggestion_form[^\"']*[\"'].*?</form>",
+    re.DOTALL | re.IGNORECASE,
+)
+date_value = re.compile(rb"(name=[\"']date[\"'][^>]*value=[\"'])(\d{8})")
+
+
+def request_key(method: str, path: str, query: bytes, body: bytes) -> str:
+    """
+    request_key creates a key which identifies equal requests independent of the order of their parameters
+
+    Args:
+        method (str): the http method
+        path (str): the path of the url
+        query (bytes): the raw query string
+        body (bytes): the raw url encoded form data
+
+    Returns:
+        str: the key
+    """
+    return json.dumps(
+        [
+            method.upper(),
+            path,
+            sorted(parse_qsl(query.decode(), keep_blank_values=True)),
+            sorted(parse_qsl(body.decode(), keep_blank_values=True)),
+        ]
+    )
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """
+    RecordingTransport wraps another transport and records all requests and their responses to a directory.
+    Redirects are followed by the client, therefore the final response of a redirect chain is recorded for the first request of the chain.
+    The key of the first request is stored in the request extensions, which the client copies to every redirect request of the chain.
+    """
+
+    def __init__(
+        self, directory: str | pathlib.Path, transport: httpx.AsyncBaseTransport
+    ):
+        """
+        Args:
+            directory (str | pathlib.Path): the directory to write the records to
+            transport (httpx.AsyncBaseTransport): the transport sending the requests
+        """
+        self.directory = pathlib.Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if CHAIN_KEY_EXTENSION not in request.extensions:
+            request.extensions[CHAIN_KEY_EXTENSION] = request_key(
+                request.method,
+                request.url.path,
+                request.url.query,
+                await request.aread(),
+            )
+
+        response = await self.transport.handle_async_request(request)
+        if response.has_redirect_location:
+            return response
+
+        raw_content = b"".join([chunk async for chunk in response.stream])
+        await response.aclose()
+        response = httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            content=raw_content,
+            extensions=response.extensions,
+        )
+        record = {
+            "key": request.extensions[CHAIN_KEY_EXTENSION],
+            "status": response.status_code,
+            "content_type": response.headers.get("content-type"),
+            # the content is stored decoded, because the replay does not send the content-encoding
+            "content": base64.b64encode(response.read()).decode(),
+        }
+        with open(self.directory / RECORDS_FILE, "a") as records_file:
+            records_file.write(json.dumps(record) + "\n")
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            content=raw_content,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def scale_slots(content: bytes, slot_scale: int) -> bytes:
+    """
+    scale_slots multiplies the appointments on a result page by repeating every suggestion form with the date moved by a year per copy
+
+    Args:
+        content (bytes): the response body
+        slot_scale (int): how many times every appointment appears afterwards
+
+    Returns:
+        bytes: the response body with the additional appointments
+    """
+
+    def repeat_form(form: re.Match) -> bytes:
+        copies = [form.group(0)]
+        for copy in range(1, slot_scale):
+
+            def move_date(date: re.Match) -> bytes:
+                moved_date = datetime.datetime.strptime(
+                    date.group(2).decode(), "%Y%m%d"
+                ) + datetime.timedelta(days=366 * copy)
+                return date.group(1) + moved_date.strftime("%Y%m%d").encode()
+
+            copies.append(date_value.sub(move_date, form.group(0)))
+        return b"".join(copies)
+
+    return time_form.sub(repeat_form, content)
+
+
+async def read_body(receive) -> bytes:
+    """
+    read_body receives the whole body of an ASGI http request
+    """
+    body = b""
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get("body", b"")
+        more_body = message.get("more_body", False)
+    return body
+
+
+async def send_response(send, status: int, content_type: str | None, content: bytes):
+    """
+    send_response sends an ASGI http response
+    """
+    headers = []
+    if content_type:
+        headers.append((b"content-type", content_type.encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": content})
+
+
+class ReplayApp:
+    """
+    ReplayApp is an ASGI app which stands in for tevis by answering requests with recorded responses.
+    A POST request is answered with the final response of its recorded redirect chain.
+    Requests without a recorded response are answered with 404.
+    """
+
+    def __init__(
+        self,
+        directory: str | pathlib.Path,
+        latency: float = 0,
+        error_rate: float = 0,
+        slot_scale: int = 1,
+    ):
+        """
+        Args:
+            directory (str | pathlib.Path): the directory containing the records
+            latency (float, optional): the average amount of seconds each response is delayed. Defaults to 0.
+            error_rate (float, optional): the share of requests answered with 503. Defaults to 0.
+            slot_scale (int, optional): how many times every recorded appointment is repeated. Defaults to 1.
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.responses: dict[str, tuple[int, str | None, bytes]] = {}
+        with open(pathlib.Path(directory) / RECORDS_FILE) as records_file:
+            for line in records_file:
+                record = json.loads(line)
+                content = base64.b64decode(record["content"])
+                if slot_scale > 1:
+                    content = scale_slots(content, slot_scale)
+                self.responses[record["key"]] = (
+                    record["status"],
+                    record["content_type"],
+                    content,
+                )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+
+        body = await read_body(receive)
+        if self.latency:
+            await asyncio.sleep(random.uniform(0, 2 * self.latency))
+
+        if random.random() < self.error_rate:
+            status, content_type, content = 503, None, b""
+        else:
+            status, content_type, content = self.responses.get(
+                request_key(
+                    scope["method"], scope["path"], scope["query_string"], body
+                ),
+                (404, None, b""),
+            )
+        await send_response(send, status, content_type, content)
+
+
+class SyntheticTevisApp:
+    """
+    SyntheticTevisApp is an ASGI app which stands in for tevis by generating result pages with a fixed amount of appointments.
+    Every appointment type and location gets its own appointments.
+    On every request the appointments of a result page change with the change rate,
+    then the first appointment is removed and a new one is added at the end.
+    """
+
+    slots_per_day = 32
+
+    def __init__(
+        self,
+        slots: int,
+        latency: float = 0,
+        error_rate: float = 0,
+        change_rate: float = 1,
+        start_date: datetime.date | None = None,
+    ):
+        """
+        Args:
+            slots (int): the amount of appointments on every result page
+            latency (float, optional): the average amount of seconds each response is delayed. Defaults to 0.
+            error_rate (float, optional): the share of requests answered with 503. Defaults to 0.
+            change_rate (float, optional): the share of result pages which change between two requests. Defaults to 1.
+            start_date (datetime.date | None, optional): the date of the first appointment. Defaults to tomorrow.
+        """
+        self.slots = slots
+        self.latency = latency
+        self.error_rate = error_rate
+        self.change_rate = change_rate
+        self.start_date = start_date or datetime.date.today() + datetime.timedelta(
+            days=1
+        )
+        self.requests = 0
+        self._offsets: dict[tuple[str, str], int] = {}
+        self._pages: dict[int, bytes] = {}
+
+    def result_page(self, offset: int) -> bytes:
+        """
+        result_page renders a result page like tevis does, starting with the appointment at offset.
+        The pages are cached, so that rendering them does not slow down the scraper running in the same event loop.
+        """
+        if offset in self._pages:
+            return self._pages[offset]
+        forms = []
+        for slot in range(offset, offset + self.slots):
+            date = self.start_date + datetime.timedelta(days=slot // self.slots_per_day)
+            start = 480 + 15 * (slot % self.slots_per_day)
+            forms.append(
+                '<form class="suggestion_form" method="post" action="suggest">'
+                f'<input type="hidden" name="date" value="{date:%Y%m%d}">'
+                f'<input type="hidden" name="start" value="{start}">'
+                f'<input type="hidden" name="end" value="{start + 15}">'
+                f'<button type="submit">{date:%d.%m.%Y} {start // 60:02d}:{start % 60:02d}</button>'
+                "</form>"
+            )
+        self._pages[offset] = (
+            "<!DOCTYPE html><html><head><title>Terminvorschläge</title></head>"
+            f'<body><div id="suggestions">{"".join(forms)}</div></body></html>'
+        ).encode()
+        return self._pages[offset]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+
+        body = await read_body(receive)
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(random.uniform(0, 2 * self.latency))
+
+        if random.random() < self.error_rate:
+            await send_response(send, 503, None, b"")
+            return
+        if scope["method"] != "POST":
+            await send_response(
+                send, 200, "text/html; charset=utf-8", b"<!DOCTYPE html><html></html>"
+            )
+            return
+
+        query = dict(parse_qsl(scope["query_string"].decode()))
+        appointment_type = next((key for key in query if key.startswith("cnc-")), None)
+        location = dict(parse_qsl(body.decode())).get("loc")
+        key = (appointment_type, location)
+        offset = self._offsets.get(key, 0)
+        if key in self._offsets and random.random() < self.change_rate:
+            offset += 1
+        self._offsets[key] = offset
+        await send_response(
+            send, 200, "text/html; charset=utf-8", self.result_page(offset)
+        )
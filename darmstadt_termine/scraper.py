@@ -1,183 +1,1073 @@
 import asyncio
+import collections
+import concurrent.futures
 import datetime
-from typing import Coroutine
+import functools
+import itertools
+import logging
+import operator
+import random
+import time
+from typing import Iterable, Iterator, NamedTuple
 
 import httpx
 from asgiref.sync import sync_to_async
-from bs4 import BeautifulSoup, Doctype, SoupStrainer
-from django.core.mail import mail_admins
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q, QuerySet
+from django.utils import timezone
 
+from .catalog import CategorySnapshot, load_catalog
+from .conf import settings
 from .models import (
     Appointment,
-    AppointmentCategory,
+    AppointmentChange,
     AppointmentType,
+    Availability,
     Location,
+    PollSchedule,
+    ResponseFingerprint,
     ScraperRun,
 )
+from .parser import (
+    AppointmentStreamParser,
+    ParseResult,
+    fingerprint_appointments,
+    parse_changed_response,
+)
+from .polling import is_due, is_quiet_time, next_poll_interval
+from .replay import RecordingTransport, ReplayApp
+from .session_pool import SessionPool
+from .utils.concurrency import RequestScheduler, gather_or_cancel
+from .utils.errors import ErrorCollector
 from .utils.time import make_aware_no_error
 
 URL = (
     "https://tevis.ekom21.de/stdar/"  # Link zum Terminvergabe Tool der Stadt Darmstadt
 )
-time_forms = SoupStrainer("form", attrs={"class": "suggestion_form"})
+BATCH_SIZE = 500
+# too many requests and server errors, which may be gone if the request is sent again
+RETRIABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+MAX_RETRY_DELAY = 60
 
+logger = logging.getLogger(__name__)
 
-async def add_appointment(
-    start_time: datetime.time,
-    end_time: datetime.time,
-    date: datetime.date,
-    appointment_type: AppointmentType,
-    location: Location,
-    scraper_run: ScraperRun,
-):
+
+class ScraperRunInProgress(Exception):
+    """
+    ScraperRunInProgress is raised if a scraper run is started while another one is running.
+    """
+
+
+class ScrapedAppointment(NamedTuple):
+    """
+    ScrapedAppointment is the natural key of an :model:`darmstadt_termine.Appointment` as parsed by the scraper.
+    """
+
+    start_time: datetime.time
+    end_time: datetime.time
+    date: datetime.date
+    appointment_type: int
+    location: int
+
+
+class FetchResult(NamedTuple):
+    """
+    FetchResult is the result of fetching the appointments of an appointment type at a location.
+    If the response did not change since the last scraper run or no response was received, appointments is None.
+    polled is False if no response was received, because the appointment type was not due at the location or the request failed.
+    digest is None if the request failed and there was no response before.
+    """
+
+    appointment_type: int
+    location: int
+    digest: str | None
+    appointments: list[ScrapedAppointment] | None
+    polled: bool = True
+
+
+class FetchedResponse(NamedTuple):
+    """
+    FetchedResponse is a response of tevis to parse.
+    If the response was parsed while it was received, parse_result is set instead of content.
+    """
+
+    appointment_type: AppointmentType
+    location: Location
+    content: bytes | None
+    parse_result: ParseResult | None
+
+
+class ScraperStats:
+    """
+    ScraperStats collects how many requests a scraper run sent and how long its phases took.
+    The durations are the summed up seconds, concurrent requests therefore add up to more than the wall time.
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.bytes_fetched = 0
+        self.slots_seen = 0
+        self.http_time = 0.0
+        self.parse_time = 0.0
+        self.db_time = 0.0
+        self.slots_new = 0
+        self.slots_removed = 0
+        self.retries = 0
+        self.errors = 0
+
+    def apply(self, scraper_run: ScraperRun):
+        """
+        apply copies the stats to the fields of the scraper run, without saving it
+        """
+        scraper_run.requests = self.requests
+        scraper_run.bytes_fetched = self.bytes_fetched
+        scraper_run.http_time = datetime.timedelta(seconds=self.http_time)
+        scraper_run.parse_time = datetime.timedelta(seconds=self.parse_time)
+        scraper_run.db_time = datetime.timedelta(seconds=self.db_time)
+        scraper_run.slots_seen = self.slots_seen
+        scraper_run.slots_new = self.slots_new
+        scraper_run.slots_removed = self.slots_removed
+        scraper_run.retries = self.retries
+        scraper_run.errors = self.errors
+
+
+def batched(iterable: Iterable, size: int = BATCH_SIZE) -> Iterator[list]:
     """
-    add_appointment writes the appointment to the database
-    if no appointment with the same data was create in the last 40 seconds
-    else it retrives it and always adds the type
-
-    Args:
-        start_time (datetime.time): the start time of the appointment
-        end_time (datetime.time): the end time of the appointment
-        date (datetime.date): the date of the appointment
-        appointment_type (AppointmentType): the type of the appointment
-    """
-    appointment, _ = await Appointment.objects.filter(
-        start_time=start_time,
-        end_time=end_time,
-        date=date,
-        location=location,
-        appointment_type=appointment_type,
-    ).aget_or_create(
-        start_time=make_aware_no_error(start_time),
-        end_time=make_aware_no_error(end_time),
-        date=date,
-        location=location,
-        appointment_type=appointment_type,
+    batched splits an iterable into lists of at most size items
+    """
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def get_appointment_ids(
+    appointments: set[ScrapedAppointment],
+) -> dict[ScrapedAppointment, int]:
+    """
+    get_appointment_ids looks up the ids of all already existing appointments in a single query
+
+    Args:
+        appointments (set[ScrapedAppointment]): the appointments to look up
+
+    Returns:
+        dict[ScrapedAppointment, int]: the appointments which exist in the database mapped to their id
+    """
+    dates = [appointment.date for appointment in appointments]
+    existing_appointments = (
+        Appointment.objects.filter(
+            appointment_type__in={
+                appointment.appointment_type for appointment in appointments
+            },
+            date__range=(min(dates), max(dates)),
+        )
+        .order_by("pk")
+        .values_list(
+            "start_time", "end_time", "date", "appointment_type", "location", "pk"
+        )
     )
-    await appointment.scraper_run.aadd(scraper_run)
 
+    appointment_ids = {}
+    for *natural_key, pk in existing_appointments.iterator():
+        appointment = ScrapedAppointment(*natural_key)
+        if appointment in appointments:
+            appointment_ids.setdefault(appointment, pk)
+    return appointment_ids
 
-async def fetch_appointment(
-    client: httpx.AsyncClient,
-    appointment_category: int,
-    appointment_type: AppointmentType,
+
+def create_appointments(appointments: set[ScrapedAppointment]) -> set[int]:
+    """
+    create_appointments creates all appointments which do not exist yet using bulk queries.
+    It is safe to run concurrently, because conflicting inserts are ignored and the existing appointments are looked up.
+
+    Args:
+        appointments (set[ScrapedAppointment]): the deduplicated appointments
+
+    Returns:
+        set[int]: the ids of all the appointments
+    """
+    if not appointments:
+        return set()
+
+    appointment_ids = get_appointment_ids(appointments)
+    missing_appointments = [
+        appointment
+        for appointment in appointments
+        if appointment not in appointment_ids
+    ]
+    # appointments created concurrently by another writer are skipped by the unique constraint
+    Appointment.objects.bulk_create(
+        [
+            Appointment(
+                start_time=make_aware_no_error(appointment.start_time),
+                end_time=make_aware_no_error(appointment.end_time),
+                date=appointment.date,
+                appointment_type_id=appointment.appointment_type,
+                location_id=appointment.location,
+            )
+            for appointment in missing_appointments
+        ],
+        ignore_conflicts=True,
+    )
+    if missing_appointments:
+        # the ids of rows inserted with ignore_conflicts are not returned
+        appointment_ids.update(get_appointment_ids(set(missing_appointments)))
+    return set(appointment_ids.values())
+
+
+def get_open_availabilities(
+    scraper_run: ScraperRun, previous_run: ScraperRun | None
+) -> QuerySet[Availability]:
+    """
+    get_open_availabilities returns the availabilities which were still available in the previous completed scraper run.
+    Scraper runs which failed after it may already have extended some of them, their availabilities are included as well.
+
+    Args:
+        scraper_run (ScraperRun): the current scraper run
+        previous_run (ScraperRun | None): the previous completed scraper run
+
+    Returns:
+        QuerySet[Availability]: the open availabilities
+    """
+    open_availabilities = Availability.objects.filter(last_seen_run__lt=scraper_run.pk)
+    if previous_run is not None:
+        open_availabilities = open_availabilities.filter(
+            last_seen_run__gte=previous_run.pk
+        )
+    return open_availabilities
+
+
+def update_availabilities(
+    appointment_ids: set[int],
+    unchanged: set[tuple[int, int]],
     scraper_run: ScraperRun,
-) -> list[Coroutine]:
-    async for location in appointment_type.location.all():
-        request = await client.post(
-            "location",
-            params={
-                "mdt": appointment_category,
-                f"cnc-{appointment_type.index}": 1,
-            },
-            data={
-                "loc": location.index,
-                "select_location": location.descriptor,
-            },
-            follow_redirects=True,
+    previous_run: ScraperRun | None,
+) -> int:
+    """
+    update_availabilities extends the open availabilities of the appointments found again to the scraper run, see get_open_availabilities.
+    Appointments which were not available in the previous scraper run get a new availability.
+    Appointments of unchanged responses are treated as found again.
+    The availabilities which are not extended until the end of the scraper run have vanished.
+    The new appointments are stored as added :model:`darmstadt_termine.AppointmentChange`s.
+
+    Args:
+        appointment_ids (set[int]): the ids of the appointments found in the scraper run
+        unchanged (set[tuple[int, int]]): the appointment type and location ids of the unchanged responses
+        scraper_run (ScraperRun): the scraper run the appointments were found in
+        previous_run (ScraperRun | None): the previous completed scraper run
+
+    Returns:
+        int: the amount of new appointments
+    """
+    still_available = set()
+    open_availabilities = get_open_availabilities(scraper_run, previous_run)
+    appointment_ids_list = list(appointment_ids)
+    for i in range(0, len(appointment_ids_list), BATCH_SIZE):
+        found_availabilities = open_availabilities.filter(
+            appointment_id__in=appointment_ids_list[i : i + BATCH_SIZE]
         )
-        try:
-            request.raise_for_status()
-        except httpx.HTTPStatusError as e:
-            mail_admins(
-                "Fehler beim Aufruf der Terminvergabe von Darmstadt",
-                f"Der Scraper hat, beim Versuch die Termine zu ermitteln, einen Verbindungsfehler erhalten:\n{e}",
+        still_available.update(
+            found_availabilities.values_list("appointment_id", flat=True)
+        )
+        found_availabilities.update(last_seen_run=scraper_run)
+
+    unchanged_types_by_location = collections.defaultdict(list)
+    for appointment_type, location in unchanged:
+        unchanged_types_by_location[location].append(appointment_type)
+    if unchanged_types_by_location:
+        open_availabilities.filter(
+            functools.reduce(
+                operator.or_,
+                (
+                    Q(
+                        appointment__location=location,
+                        appointment__appointment_type__in=appointment_types,
+                    )
+                    for location, appointment_types in unchanged_types_by_location.items()
+                ),
             )
-            raise e
+        ).update(last_seen_run=scraper_run)
 
-        soup = BeautifulSoup(request.text, "lxml", parse_only=time_forms)
-        tasks = []
+    new_appointment_ids = appointment_ids - still_available
+    Availability.objects.bulk_create(
+        [
+            Availability(
+                appointment_id=appointment_id,
+                first_seen_run=scraper_run,
+                last_seen_run=scraper_run,
+            )
+            for appointment_id in new_appointment_ids
+        ]
+    )
+    AppointmentChange.objects.bulk_create(
+        [
+            AppointmentChange(
+                scraper_run=scraper_run, appointment_id=appointment_id, added=True
+            )
+            for appointment_id in new_appointment_ids
+        ]
+    )
+    return len(new_appointment_ids)
 
-        for element in soup:
-            if isinstance(element, Doctype):
-                element.extract()
-                continue
-            try:
-                start_time = int(
-                    element.findNext("input", attrs={"name": "start"})["value"]
-                )  # in minutes
-                end_time = int(
-                    element.findNext("input", attrs={"name": "end"})["value"]
-                )  # in minutes
-                date: str = element.findNext("input", attrs={"name": "date"})[
-                    "value"
-                ]  # format YYYYMMDD
-            except TypeError:
-                mail_admins(
-                    "Fehler beim Parsen der Termine",
-                    f"Das nachfolgende Terminelement konnte nicht geparst werden.\nURL:{request.url}\nParsed element:\n{element}\nSoup:\n{soup}\nAnfragetext:\n{request.text}",
-                )
-                continue
-            tasks.append(
-                add_appointment(
-                    start_time=datetime.time(
-                        minute=start_time % 60, hour=start_time // 60
-                    ),
-                    end_time=datetime.time(minute=end_time % 60, hour=end_time // 60),
-                    date=datetime.datetime.strptime(date, "%Y%m%d").date(),
-                    appointment_type=appointment_type,
-                    location=location,
+
+def update_poll_schedules(results: list[FetchResult], now: datetime.datetime):
+    """
+    update_poll_schedules adapts the poll interval of all polled appointment types at their locations to how often their responses change
+
+    Args:
+        results (list[FetchResult]): the results of requests of the scraper run
+        now (datetime.datetime): the start time of the scraper run
+    """
+    previous_schedules = {
+        (appointment_type, location): (interval, last_change)
+        for appointment_type, location, interval, last_change in (
+            PollSchedule.objects.filter(
+                appointment_type__in={result.appointment_type for result in results}
+            )
+            .values_list("appointment_type", "location", "interval", "last_change")
+            .iterator()
+        )
+    }
+    minimum = datetime.timedelta(
+        seconds=settings.DARMSTADT_TERMINE_SCRAPER_POLL_INTERVAL_MIN
+    )
+    maximum = datetime.timedelta(
+        seconds=settings.DARMSTADT_TERMINE_SCRAPER_POLL_INTERVAL_MAX
+    )
+
+    poll_schedules = []
+    for result in results:
+        if not result.polled:
+            continue
+        changed = result.appointments is not None
+        previous_interval, last_change = previous_schedules.get(
+            (result.appointment_type, result.location), (None, None)
+        )
+        interval = next_poll_interval(
+            previous_interval,
+            changed,
+            minimum,
+            maximum,
+            settings.DARMSTADT_TERMINE_SCRAPER_POLL_INTERVAL_FACTOR,
+        )
+        poll_schedules.append(
+            PollSchedule(
+                appointment_type_id=result.appointment_type,
+                location_id=result.location,
+                interval=interval,
+                next_poll=now + interval,
+                last_change=now if changed else last_change,
+            )
+        )
+
+    PollSchedule.objects.bulk_create(
+        poll_schedules,
+        update_conflicts=True,
+        unique_fields=["appointment_type", "location"],
+        update_fields=["interval", "next_poll", "last_change"],
+    )
+
+
+def save_results(
+    results: list[FetchResult],
+    scraper_run: ScraperRun,
+    previous_run: ScraperRun | None,
+) -> int:
+    """
+    save_results writes a batch of results of a scraper run to the database using bulk queries in one transaction.
+    Appointments which do not exist yet are created and the availabilities of all of them are updated.
+    For unchanged responses the appointments of the previous scraper run stay available.
+    The fingerprints of the responses are stored for the next scraper run and the poll schedules are updated.
+
+    Args:
+        results (list[FetchResult]): results of requests of the scraper run, every appointment type and location may only be in one batch
+        scraper_run (ScraperRun): the scraper run the appointments were found in
+        previous_run (ScraperRun | None): the previous completed scraper run
+
+    Returns:
+        int: the amount of new appointments
+    """
+    appointments = {
+        appointment
+        for result in results
+        if result.appointments is not None
+        for appointment in result.appointments
+    }
+    unchanged = {
+        (result.appointment_type, result.location)
+        for result in results
+        if result.appointments is None
+    }
+
+    with transaction.atomic():
+        slots_new = update_availabilities(
+            create_appointments(appointments), unchanged, scraper_run, previous_run
+        )
+        ResponseFingerprint.objects.bulk_create(
+            [
+                ResponseFingerprint(
+                    appointment_type_id=result.appointment_type,
+                    location_id=result.location,
                     scraper_run=scraper_run,
+                    digest=result.digest,
                 )
+                for result in results
+                if result.digest is not None
+            ],
+            update_conflicts=True,
+            unique_fields=["appointment_type", "location"],
+            update_fields=["scraper_run", "digest"],
+        )
+        update_poll_schedules(results, scraper_run.start_time)
+    return slots_new
+
+
+def save_vanished(scraper_run: ScraperRun, previous_run: ScraperRun | None) -> int:
+    """
+    save_vanished stores the appointments of the open availabilities which were not extended to the scraper run
+    as removed :model:`darmstadt_termine.AppointmentChange`s. It has to be called after all results of the scraper run were saved.
+
+    Args:
+        scraper_run (ScraperRun): the scraper run the appointments vanished in
+        previous_run (ScraperRun | None): the previous completed scraper run
+
+    Returns:
+        int: the amount of vanished appointments
+    """
+    vanished = get_open_availabilities(scraper_run, previous_run).values_list(
+        "appointment_id", flat=True
+    )
+    count = 0
+    with transaction.atomic():
+        for appointment_ids in batched(vanished.iterator(chunk_size=BATCH_SIZE)):
+            AppointmentChange.objects.bulk_create(
+                [
+                    AppointmentChange(
+                        scraper_run=scraper_run,
+                        appointment_id=appointment_id,
+                        added=False,
+                    )
+                    for appointment_id in appointment_ids
+                ]
             )
-    return tasks
+            count += len(appointment_ids)
+    return count
 
 
-async def fetch_appointments(
+def is_retriable(error: httpx.HTTPError) -> bool:
+    """
+    is_retriable checks whether a failed request may succeed if it is sent again,
+    that is if it failed on the connection, timed out, was throttled or tevis had a server error
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRIABLE_STATUS_CODES
+    return isinstance(error, httpx.TransportError)
+
+
+def get_retry_delay(error: httpx.HTTPError, attempt: int) -> float:
+    """
+    get_retry_delay returns the seconds to wait before the next attempt.
+    The delay doubles with every attempt and is randomized, the Retry-After header of tevis is respected.
+
+    Args:
+        error (httpx.HTTPError): the error of the failed attempt
+        attempt (int): the number of the failed attempt, starting at 0
+
+    Returns:
+        float: the seconds to wait
+    """
+    delay = settings.DARMSTADT_TERMINE_SCRAPER_RETRY_BACKOFF * 2**attempt
+    delay = random.uniform(delay / 2, delay)
+    if isinstance(error, httpx.HTTPStatusError):
+        try:
+            delay = max(delay, float(error.response.headers.get("retry-after", 0)))
+        except ValueError:
+            pass
+    return min(delay, MAX_RETRY_DELAY)
+
+
+async def request_appointments(
+    scheduler: RequestScheduler,
+    session_pool: SessionPool,
     department_index: int,
     appointment_category: int,
-    appointment_types,
-    scraper_run: ScraperRun,
-):
+    appointment_type: AppointmentType,
+    location: Location,
+    stats: ScraperStats,
+    stream_parser: AppointmentStreamParser | None = None,
+) -> httpx.Response:
     """
-    fetch_appointments looks for all available appointments of a specific type
+    request_appointments sends the request for the appointments of a type at a location once.
+    Throttled requests and server errors decrease the concurrency limit of the scheduler.
+    If a stream parser is given, the response is parsed while it is received and its content is not kept,
+    the time spent receiving it then includes the parse time.
 
     Args:
+        scheduler (RequestScheduler): the scheduler limiting the concurrent requests
+        session_pool (SessionPool): the pool providing the tevis sessions
+        department_index (int): the department index used in the url
         appointment_category (int): the appointment category index used in the url
-        appointment_type (int): the appointment type index used in the url
+        appointment_type (AppointmentType): the appointment type to look for
+        location (Location): the location to look at
+        stats (ScraperStats): the stats of the scraper run
+        stream_parser (AppointmentStreamParser | None, optional): the parser the response is fed to. Defaults to None.
+
+    Raises:
+        httpx.HTTPError: if the request failed
+
+    Returns:
+        httpx.Response: the response of tevis
     """
-    if await appointment_types.acount() == 0:
-        return
-    async with httpx.AsyncClient(
-        base_url=URL, headers={"user-agent": "Termin-Scraper/1.0"}, max_redirects=50
+    async with session_pool.session(
+        scheduler, department_index, appointment_category, appointment_type.index
     ) as client:
-        await client.get("select2", params={"md": department_index})
-        await client.get(
-            "location",
-            params={
-                "mdt": appointment_category,
-                f"cnc-{(await appointment_types.afirst()).index}": 1,
-            },
+        async with scheduler.limit(client.base_url.host) as slot:
+            request_start = time.perf_counter()
+            async with client.stream(
+                "POST",
+                "location",
+                params={
+                    "mdt": appointment_category,
+                    f"cnc-{appointment_type.index}": 1,
+                },
+                data={
+                    "loc": location.index,
+                    "select_location": location.descriptor,
+                },
+                follow_redirects=True,
+            ) as request:
+                if stream_parser is None or request.is_error:
+                    await request.aread()
+                else:
+                    async for chunk in request.aiter_bytes():
+                        parse_start = time.perf_counter()
+                        stream_parser.feed(chunk)
+                        stats.parse_time += time.perf_counter() - parse_start
+            stats.http_time += time.perf_counter() - request_start
+            if request.status_code in RETRIABLE_STATUS_CODES:
+                slot.throttled()
+        stats.requests += 1
+        stats.bytes_fetched += request.num_bytes_downloaded
+        # raised within the session, so that the session is not reused
+        request.raise_for_status()
+    return request
+
+
+async def fetch_response(
+    scheduler: RequestScheduler,
+    session_pool: SessionPool,
+    department_index: int,
+    appointment_category: int,
+    appointment_type: AppointmentType,
+    location: Location,
+    fingerprints: dict[tuple[int, int], str],
+    stats: ScraperStats,
+    error_collector: ErrorCollector,
+) -> FetchedResponse | FetchResult:
+    """
+    fetch_response requests the available appointments of a type at a location.
+    With the streaming parser the response is parsed while it is received.
+    Failed requests are retried, if they still fail the appointments found in the previous scraper run stay available.
+
+    Args:
+        scheduler (RequestScheduler): the scheduler limiting the concurrent requests
+        session_pool (SessionPool): the pool providing the tevis sessions
+        department_index (int): the department index used in the url
+        appointment_category (int): the appointment category index used in the url
+        appointment_type (AppointmentType): the appointment type to look for
+        location (Location): the location to look at
+        fingerprints (dict[tuple[int, int], str]): the response fingerprints of the previous scraper run
+        stats (ScraperStats): the stats of the scraper run
+        error_collector (ErrorCollector): the collector of the errors reported after the scraper run
+
+    Returns:
+        FetchedResponse | FetchResult: the response to parse or the result if the request failed
+    """
+    for attempt in range(settings.DARMSTADT_TERMINE_SCRAPER_MAX_RETRIES + 1):
+        stream_parser = (
+            AppointmentStreamParser()
+            if settings.DARMSTADT_TERMINE_SCRAPER_STREAMING_PARSER
+            else None
         )
-        tasks = []
-        async for appointment_type in appointment_types.aiterator():
-            tasks.extend(
-                await fetch_appointment(
-                    client, appointment_category, appointment_type, scraper_run
+        try:
+            request = await request_appointments(
+                scheduler,
+                session_pool,
+                department_index,
+                appointment_category,
+                appointment_type,
+                location,
+                stats,
+                stream_parser,
+            )
+            break
+        except httpx.HTTPError as e:
+            if (
+                attempt == settings.DARMSTADT_TERMINE_SCRAPER_MAX_RETRIES
+                or not is_retriable(e)
+            ):
+                stats.errors += 1
+                logger.warning(
+                    "Request for %s at %s failed: %s", appointment_type, location, e
+                )
+                if isinstance(e, httpx.HTTPStatusError):
+                    detail = f"{e.response.status_code} {e.response.reason_phrase}"
+                else:
+                    detail = f"{type(e).__name__}: {e}"
+                error_collector.add(
+                    "Verbindungsfehler beim Aufruf der Terminvergabe",
+                    detail,
+                    f"{appointment_type} ({location})",
+                )
+                return FetchResult(
+                    appointment_type.pk,
+                    location.pk,
+                    fingerprints.get((appointment_type.pk, location.pk)),
+                    None,
+                    polled=False,
                 )
+            stats.retries += 1
+            await asyncio.sleep(get_retry_delay(e, attempt))
+
+    if stream_parser is not None:
+        return FetchedResponse(appointment_type, location, None, stream_parser.close())
+    return FetchedResponse(appointment_type, location, request.content, None)
+
+
+async def parse_response(
+    response: FetchedResponse,
+    fingerprints: dict[tuple[int, int], str],
+    stats: ScraperStats,
+    error_collector: ErrorCollector,
+    parse_executor: concurrent.futures.Executor | None = None,
+) -> FetchResult:
+    """
+    parse_response extracts the appointments from a response.
+    If the response is the same as in the previous scraper run, it is not parsed.
+    A response parsed while it was received is compared by its parsed appointments instead.
+    Otherwise the response is parsed in the parse executor if one is given, the parse time then includes waiting for a worker.
+
+    Args:
+        response (FetchedResponse): the response
+        fingerprints (dict[tuple[int, int], str]): the response fingerprints of the previous scraper run
+        stats (ScraperStats): the stats of the scraper run
+        error_collector (ErrorCollector): the collector of the errors reported after the scraper run
+        parse_executor (concurrent.futures.Executor | None, optional): the executor parsing the responses.
+            Defaults to None, which parses them in the event loop.
+
+    Returns:
+        FetchResult: the appointments found
+    """
+    appointment_type, location = response.appointment_type, response.location
+    parse_start = time.perf_counter()
+    previous_digest = fingerprints.get((appointment_type.pk, location.pk))
+    if response.parse_result is not None:
+        parse_result = response.parse_result
+        digest = fingerprint_appointments(parse_result)
+        if digest == previous_digest:
+            parse_result = None
+    else:
+        parse_arguments = (
+            response.content,
+            tuple(settings.DARMSTADT_TERMINE_SCRAPER_FINGERPRINT_IGNORE_PATTERNS),
+            previous_digest,
+        )
+        if parse_executor is None:
+            digest, parse_result = parse_changed_response(*parse_arguments)
+        else:
+            digest, parse_result = await asyncio.get_running_loop().run_in_executor(
+                parse_executor, parse_changed_response, *parse_arguments
             )
+    if parse_result is None:
+        stats.parse_time += time.perf_counter() - parse_start
+        return FetchResult(appointment_type.pk, location.pk, digest, None)
+
+    appointments, invalid_elements = parse_result
+    stats.parse_time += time.perf_counter() - parse_start
+    stats.slots_seen += len(appointments)
+    stats.errors += len(invalid_elements)
+    for element in invalid_elements:
+        error_collector.add(
+            "Terminelement konnte nicht geparst werden",
+            element,
+            f"{appointment_type} ({location})",
+        )
 
-        await asyncio.gather(*tasks)
+    return FetchResult(
+        appointment_type.pk,
+        location.pk,
+        digest,
+        [
+            ScrapedAppointment(
+                start_time=appointment.start_time,
+                end_time=appointment.end_time,
+                date=appointment.date,
+                appointment_type=appointment_type.pk,
+                location=location.pk,
+            )
+            for appointment in appointments
+        ],
+    )
 
 
-async def fetch_all_types():
+async def fetch_responses(
+    scheduler: RequestScheduler,
+    session_pool: SessionPool,
+    appointment_category: CategorySnapshot,
+    fingerprints: dict[tuple[int, int], str],
+    skipped: set[tuple[int, int]],
+    stats: ScraperStats,
+    error_collector: ErrorCollector,
+    responses: asyncio.Queue,
+):
     """
-    fetch_all_types fetches appointments for all types
+    fetch_responses is the fetch stage for a category, it puts the responses for all types and locations of the category into the queue.
+    As many requests are sent concurrently as the category has tevis sessions.
+    Appointment types which are not due at a location are not requested and their last response is reused.
+
+    Args:
+        scheduler (RequestScheduler): the scheduler limiting the concurrent requests
+        session_pool (SessionPool): the pool providing the tevis sessions
+        appointment_category (CategorySnapshot): the appointment category with the appointment types and locations to look at
+        fingerprints (dict[tuple[int, int], str]): the response fingerprints of the previous scraper run
+        skipped (set[tuple[int, int]]): the appointment type and location ids which are not due
+        stats (ScraperStats): the stats of the scraper run
+        error_collector (ErrorCollector): the collector of the errors reported after the scraper run
+        responses (asyncio.Queue[FetchedResponse | FetchResult]): the queue of the parse stage
     """
-    appointment_categories = await sync_to_async(
-        AppointmentCategory.objects.prefetch_related("types", "department").all
-    )()
-    scraper_run = ScraperRun()
-    await scraper_run.asave()
+    # shared by the workers, every request is taken by one of them
+    requests = iter(appointment_category.requests)
+
+    async def fetch_worker():
+        for appointment_type, location in requests:
+            if (appointment_type.pk, location.pk) in skipped:
+                await responses.put(
+                    FetchResult(
+                        appointment_type.pk,
+                        location.pk,
+                        fingerprints[(appointment_type.pk, location.pk)],
+                        None,
+                        polled=False,
+                    )
+                )
+                continue
+            await responses.put(
+                await fetch_response(
+                    scheduler,
+                    session_pool,
+                    appointment_category.department_index,
+                    appointment_category.index,
+                    appointment_type,
+                    location,
+                    fingerprints,
+                    stats,
+                    error_collector,
+                )
+            )
+
     await asyncio.gather(
         *[
-            fetch_appointments(
-                appointment_category.department.index,
-                appointment_category.index,
-                appointment_category.types.filter(active=True),
-                scraper_run,
-            )
-            async for appointment_category in appointment_categories
+            fetch_worker()
+            for _ in range(settings.DARMSTADT_TERMINE_SCRAPER_SESSIONS_PER_CATEGORY)
         ]
     )
-    await scraper_run.asave()
+
+
+async def parse_responses(
+    responses: asyncio.Queue,
+    results: asyncio.Queue,
+    fingerprints: dict[tuple[int, int], str],
+    stats: ScraperStats,
+    error_collector: ErrorCollector,
+    parse_executor: concurrent.futures.Executor | None = None,
+):
+    """
+    parse_responses is a worker of the parse stage, it parses responses until it takes None from the queue.
+    Results of requests which were not sent or failed are passed on unchanged.
+
+    Args:
+        responses (asyncio.Queue[FetchedResponse | FetchResult | None]): the queue of the parse stage
+        results (asyncio.Queue[FetchResult | None]): the queue of the write stage
+        fingerprints (dict[tuple[int, int], str]): the response fingerprints of the previous scraper run
+        stats (ScraperStats): the stats of the scraper run
+        error_collector (ErrorCollector): the collector of the errors reported after the scraper run
+        parse_executor (concurrent.futures.Executor | None, optional): the executor parsing the responses. Defaults to None.
+    """
+    while (response := await responses.get()) is not None:
+        if isinstance(response, FetchResult):
+            await results.put(response)
+        else:
+            await results.put(
+                await parse_response(
+                    response, fingerprints, stats, error_collector, parse_executor
+                )
+            )
+
+
+async def write_results(
+    results: asyncio.Queue,
+    scraper_run: ScraperRun,
+    previous_run: ScraperRun | None,
+    stats: ScraperStats,
+):
+    """
+    write_results is the write stage, the only one writing to the database.
+    It collects the results until None is taken from the queue and saves them in batches of about BATCH_SIZE appointments,
+    each batch in its own transaction. A batch is saved while the other stages go on fetching and parsing.
+
+    Args:
+        results (asyncio.Queue[FetchResult | None]): the queue of the write stage
+        scraper_run (ScraperRun): the scraper run the appointments were found in
+        previous_run (ScraperRun | None): the previous completed scraper run
+        stats (ScraperStats): the stats of the scraper run
+    """
+    batch = []
+    batch_size = 0
+    while True:
+        result = await results.get()
+        if result is not None:
+            batch.append(result)
+            # unchanged results cost a query as well
+            batch_size += len(result.appointments or ()) or 1
+        if batch and (result is None or batch_size >= BATCH_SIZE):
+            db_start = time.perf_counter()
+            stats.slots_new += await sync_to_async(save_results)(
+                batch, scraper_run, previous_run
+            )
+            stats.db_time += time.perf_counter() - db_start
+            batch = []
+            batch_size = 0
+        if result is None:
+            break
+
+    db_start = time.perf_counter()
+    stats.slots_removed = await sync_to_async(save_vanished)(scraper_run, previous_run)
+    stats.db_time += time.perf_counter() - db_start
+
+
+def create_request_scheduler() -> RequestScheduler:
+    """
+    create_request_scheduler creates a request scheduler configured by the app settings
+    """
+    return RequestScheduler(
+        settings.DARMSTADT_TERMINE_SCRAPER_MAX_CONCURRENCY,
+        settings.DARMSTADT_TERMINE_SCRAPER_MAX_CONCURRENCY_PER_HOST,
+        settings.DARMSTADT_TERMINE_SCRAPER_MIN_CONCURRENCY_PER_HOST,
+        settings.DARMSTADT_TERMINE_SCRAPER_INITIAL_CONCURRENCY_PER_HOST,
+    )
+
+
+def create_session_pool(record_directory: str | None = None) -> SessionPool:
+    """
+    create_session_pool creates a session pool for tevis configured by the app settings.
+    If SCRAPER_REPLAY is set, the responses are replayed from a recording instead.
+
+    Args:
+        record_directory (str | None, optional): the directory to record all requests and responses to. Defaults to None.
+    """
+    transport = None
+    if settings.DARMSTADT_TERMINE_SCRAPER_REPLAY:
+        transport = httpx.ASGITransport(
+            ReplayApp(**settings.DARMSTADT_TERMINE_SCRAPER_REPLAY)
+        )
+    if record_directory is not None:
+        transport = RecordingTransport(
+            record_directory,
+            transport
+            or httpx.AsyncHTTPTransport(http2=settings.DARMSTADT_TERMINE_SCRAPER_HTTP2),
+        )
+
+    return SessionPool(
+        settings.DARMSTADT_TERMINE_SCRAPER_URL or URL,
+        settings.DARMSTADT_TERMINE_SCRAPER_SESSIONS_PER_CATEGORY,
+        settings.DARMSTADT_TERMINE_SCRAPER_SESSION_TIMEOUT,
+        http2=settings.DARMSTADT_TERMINE_SCRAPER_HTTP2,
+        transport=transport,
+    )
+
+
+def start_scraper_run() -> ScraperRun:
+    """
+    start_scraper_run creates a running scraper run, the database allows only one running scraper run at a time.
+    Scraper runs which are running longer than SCRAPER_RUN_TIMEOUT crashed without completing and are marked as failed first.
+
+    Raises:
+        ScraperRunInProgress: if another scraper run is running
+
+    Returns:
+        ScraperRun: the scraper run
+    """
+    ScraperRun.objects.filter(
+        status=ScraperRun.Status.RUNNING,
+        start_time__lt=timezone.now()
+        - datetime.timedelta(seconds=settings.DARMSTADT_TERMINE_SCRAPER_RUN_TIMEOUT),
+    ).update(status=ScraperRun.Status.FAILED)
+    try:
+        with transaction.atomic():
+            return ScraperRun.objects.create()
+    except IntegrityError:
+        raise ScraperRunInProgress("Another scraper run is in progress")
+
+
+async def fetch_all_types(
+    session_pool: SessionPool | None = None,
+    scheduler: RequestScheduler | None = None,
+    parse_executor: concurrent.futures.Executor | None = None,
+) -> ScraperStats:
+    """
+    fetch_all_types fetches appointments for all types.
+    The run is a pipeline of a fetch, a parse and a write stage connected by bounded queues, see fetch_responses, parse_responses and write_results.
+    The errors of the run are mailed to the admins in a single summary afterwards.
+    The scraper run continues from the previous completed scraper run, it is marked as completed when its stats are saved
+    and as failed if it raises an exception.
+
+    Args:
+        session_pool (SessionPool | None, optional): the pool providing the tevis sessions, it is kept open after the run.
+            If None a new pool is created and closed after the run. Defaults to None.
+        scheduler (RequestScheduler | None, optional): the scheduler limiting the concurrent requests,
+            passing the same scheduler to multiple runs keeps the concurrency it adapted to. Defaults to None, a new scheduler.
+        parse_executor (concurrent.futures.Executor | None, optional): the executor parsing the responses, for example a process pool.
+            Defaults to None, which parses them in the event loop.
+
+    Returns:
+        ScraperStats: the stats of the scraper run
+
+    Raises:
+        ScraperRunInProgress: if another scraper run is running
+    """
+    if session_pool is None:
+        async with create_session_pool() as session_pool:
+            return await fetch_all_types(session_pool, scheduler, parse_executor)
+
+    catalog = await sync_to_async(load_catalog)()
+    previous_run = (
+        await ScraperRun.objects.filter(status=ScraperRun.Status.COMPLETED)
+        .order_by("-start_time")
+        .afirst()
+    )
+    previous_fingerprints = ResponseFingerprint.objects.filter(
+        scraper_run=previous_run
+    ).values_list("appointment_type", "location", "digest")
+    fingerprints = {
+        (appointment_type, location): digest
+        async for appointment_type, location, digest in previous_fingerprints
+    }
+    scraper_run = await sync_to_async(start_scraper_run)()
+    stats = ScraperStats()
+    error_collector = ErrorCollector()
+    try:
+        quiet = is_quiet_time(
+            timezone.localtime(scraper_run.start_time).time(),
+            settings.DARMSTADT_TERMINE_SCRAPER_QUIET_HOURS,
+        )
+        next_polls = PollSchedule.objects.values_list(
+            "appointment_type", "location", "next_poll"
+        )
+        skipped = {
+            (appointment_type, location)
+            async for appointment_type, location, next_poll in next_polls
+            if (appointment_type, location) in fingerprints
+            and not is_due(next_poll, scraper_run.start_time, quiet)
+        }
+        if scheduler is None:
+            scheduler = create_request_scheduler()
+        # the queues are bounded, so that fetching waits for parsing and parsing for writing
+        responses = asyncio.Queue(settings.DARMSTADT_TERMINE_SCRAPER_MAX_CONCURRENCY)
+        results = asyncio.Queue(BATCH_SIZE)
+        parse_workers = (
+            settings.DARMSTADT_TERMINE_SCRAPER_MAX_CONCURRENCY
+            if parse_executor is not None
+            else 1
+        )
+
+        async def fetch_stage():
+            await asyncio.gather(
+                *[
+                    fetch_responses(
+                        scheduler,
+                        session_pool,
+                        appointment_category,
+                        fingerprints,
+                        skipped,
+                        stats,
+                        error_collector,
+                        responses,
+                    )
+                    for appointment_category in catalog.categories
+                ]
+            )
+            for _ in range(parse_workers):
+                await responses.put(None)
+
+        async def parse_stage():
+            await asyncio.gather(
+                *[
+                    parse_responses(
+                        responses,
+                        results,
+                        fingerprints,
+                        stats,
+                        error_collector,
+                        parse_executor,
+                    )
+                    for _ in range(parse_workers)
+                ]
+            )
+            await results.put(None)
+
+        await gather_or_cancel(
+            fetch_stage(),
+            parse_stage(),
+            write_results(results, scraper_run, previous_run, stats),
+        )
+        stats.apply(scraper_run)
+        scraper_run.status = ScraperRun.Status.COMPLETED
+        await scraper_run.asave()
+    finally:
+        if scraper_run.status == ScraperRun.Status.RUNNING:
+            await ScraperRun.objects.filter(pk=scraper_run.pk).aupdate(
+                status=ScraperRun.Status.FAILED
+            )
+        # a failing summary mail must not replace the result or the exception of the scraper run
+        try:
+            await error_collector.asend("Fehler beim Abruf der Termine von Darmstadt")
+        except Exception:
+            logger.exception("Sending the error summary of the scraper run failed")
+    return stats
+
+
+async def run_daemon(
+    session_pool: SessionPool,
+    interval: float,
+    stop_event: asyncio.Event,
+    parse_executor: concurrent.futures.Executor | None = None,
+):
+    """
+    run_daemon fetches appointments for all types every interval seconds until the stop event is set.
+    The tevis sessions, the adapted concurrency and the database connection are reused between the scraper runs.
+    A scraper run which is in progress when the stop event is set is finished first.
+
+    Args:
+        session_pool (SessionPool): the pool providing the tevis sessions
+        interval (float): the amount of seconds between the starts of two scraper runs
+        stop_event (asyncio.Event): the event which stops the daemon
+        parse_executor (concurrent.futures.Executor | None, optional): the executor parsing the responses. Defaults to None.
+    """
+    loop = asyncio.get_running_loop()
+    scheduler = create_request_scheduler()
+    while not stop_event.is_set():
+        start_time = loop.time()
+        try:
+            await fetch_all_types(session_pool, scheduler, parse_executor)
+        except ScraperRunInProgress:
+            logger.warning("Scraper run skipped, another scraper run is in progress")
+        except Exception:
+            logger.exception("Scraper run failed")
+        await sync_to_async(close_old_connections)()
+
+        try:
+            await asyncio.wait_for(
+                stop_event.wait(),
+                timeout=max(0, interval - (loop.time() - start_time)),
+            )
+        except asyncio.TimeoutError:
+            pass
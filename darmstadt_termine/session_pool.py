@@ -0,0 +1,186 @@
+import asyncio
+import contextlib
+import time
+from typing import AsyncIterator
+
+import httpx
+
+from .utils.concurrency import RequestScheduler
+
+
+class TevisSession:
+    """
+    TevisSession wraps a client with its own cookies, that is a session on tevis.
+    It remembers for which department and appointment category the session was opened.
+    """
+
+    def __init__(self, client: httpx.AsyncClient) -> None:
+        self.client = client
+        self.department_index: int | None = None
+        self.appointment_category: int | None = None
+        self.last_used = 0.0
+
+    def is_expired(self, timeout: float) -> bool:
+        return time.monotonic() - self.last_used > timeout
+
+
+class SessionPool:
+    """
+    SessionPool keeps opened tevis sessions alive so they can be reused by later requests, categories and scraper runs.
+    All sessions share one connection pool, therefore connections are kept alive between requests of different sessions.
+    A session is only opened again, if it was idle for longer than the session timeout.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        sessions_per_category: int,
+        session_timeout: float,
+        http2: bool = False,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ) -> None:
+        """
+        Args:
+            base_url (str): the url of tevis
+            sessions_per_category (int): the maximum amount of sessions used for one appointment category at the same time
+            session_timeout (float): the amount of seconds after which an idle session has to be opened again
+            http2 (bool, optional): whether to use HTTP/2, requires the h2 package. Defaults to False.
+            transport (httpx.AsyncBaseTransport | None, optional): the transport to send the requests with, closed together with the pool.
+                If None a new connection pool is used. Defaults to None.
+        """
+        self.base_url = base_url
+        self.sessions_per_category = sessions_per_category
+        self.session_timeout = session_timeout
+        self._transport = transport or httpx.AsyncHTTPTransport(http2=http2)
+        self._idle_sessions: list[TevisSession] = []
+        self._category_semaphores: dict[int, asyncio.Semaphore] = {}
+
+    def _create_session(self) -> TevisSession:
+        return TevisSession(
+            httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"user-agent": "Termin-Scraper/1.0"},
+                max_redirects=50,
+                transport=self._transport,
+            )
+        )
+
+    def _get_category_semaphore(self, appointment_category: int) -> asyncio.Semaphore:
+        if appointment_category not in self._category_semaphores:
+            self._category_semaphores[appointment_category] = asyncio.Semaphore(
+                self.sessions_per_category
+            )
+        return self._category_semaphores[appointment_category]
+
+    def _pop_idle_session(
+        self, department_index: int, appointment_category: int
+    ) -> TevisSession:
+        """
+        _pop_idle_session returns the idle session which needs the least requests to be ready for the category
+        """
+        best_session = None
+        for session in self._idle_sessions:
+            if session.is_expired(self.session_timeout):
+                continue
+            if session.appointment_category == appointment_category:
+                best_session = session
+                break
+            if best_session is None and session.department_index == department_index:
+                best_session = session
+
+        if best_session is None:
+            best_session = next(
+                (
+                    session
+                    for session in self._idle_sessions
+                    if session.is_expired(self.session_timeout)
+                ),
+                None,
+            )
+
+        if best_session is None:
+            return self._create_session()
+        self._idle_sessions.remove(best_session)
+        return best_session
+
+    async def _open(
+        self,
+        scheduler: RequestScheduler,
+        session: TevisSession,
+        department_index: int,
+        appointment_category: int,
+        appointment_type_index: int,
+    ):
+        """
+        _open selects the department and the appointment category in the session, if they are not already selected
+        """
+        if session.is_expired(self.session_timeout):
+            session.client.cookies.clear()
+            session.department_index = session.appointment_category = None
+
+        if (
+            session.department_index == department_index
+            and session.appointment_category == appointment_category
+        ):
+            return
+
+        async with scheduler.limit(session.client.base_url.host):
+            if session.department_index != department_index:
+                await session.client.get("select2", params={"md": department_index})
+                session.department_index = department_index
+            await session.client.get(
+                "location",
+                params={
+                    "mdt": appointment_category,
+                    f"cnc-{appointment_type_index}": 1,
+                },
+            )
+            session.appointment_category = appointment_category
+
+    @contextlib.asynccontextmanager
+    async def session(
+        self,
+        scheduler: RequestScheduler,
+        department_index: int,
+        appointment_category: int,
+        appointment_type_index: int,
+    ) -> AsyncIterator[httpx.AsyncClient]:
+        """
+        session provides a client with an opened session for the appointment category.
+        A session only handles one request at a time, because tevis stores the selection of the last request in the session.
+        If the context exits with an exception the session is discarded.
+
+        Args:
+            scheduler (RequestScheduler): the scheduler limiting the concurrent requests
+            department_index (int): the department index used in the url
+            appointment_category (int): the appointment category index used in the url
+            appointment_type_index (int): the index of any appointment type of the category
+
+        Yields:
+            httpx.AsyncClient: the client holding the session
+        """
+        async with self._get_category_semaphore(appointment_category):
+            session = self._pop_idle_session(department_index, appointment_category)
+            await self._open(
+                scheduler,
+                session,
+                department_index,
+                appointment_category,
+                appointment_type_index,
+            )
+            yield session.client
+            session.last_used = time.monotonic()
+            self._idle_sessions.append(session)
+
+    async def aclose(self):
+        """
+        aclose closes all connections of the pool
+        """
+        self._idle_sessions.clear()
+        await self._transport.aclose()
+
+    async def __aenter__(self) -> "SessionPool":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
@@ -1,3 +1,1072 @@
-from django.test import TestCase
+import asyncio
+import base64
+import concurrent.futures
+import datetime
+import functools
+import io
+import json
+import multiprocessing
+import pathlib
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+import httpx
+from asgiref.sync import async_to_sync
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.utils import timezone
+
+from . import scraper
+from .management.commands import send_notifications
+from .management.commands.benchmark_scraper import create_catalog
+from .models import (
+    Appointment,
+    AppointmentChange,
+    AppointmentType,
+    Availability,
+    DailyAvailability,
+    Location,
+    Notification,
+    OutboxMessage,
+    ScraperRun,
+)
+from .parser import (
+    AppointmentStreamParser,
+    ParseResult,
+    parse_appointments_lxml,
+    parse_appointments_soup,
+)
+from .polling import POLL_TOLERANCE, is_due, next_poll_interval
+from .replay import RECORDS_FILE, RecordingTransport, SyntheticTevisApp
+from .session_pool import SessionPool
+from .tokens import OneTimeTokenGenerator
+from .utils.concurrency import AdaptiveLimit
+from .utils.email import create_notification_email_message_for_new_appointments
+from .utils.models import (
+    AppointmentTuple,
+    get_added_appointments,
+    get_scraper_run_appointments,
+)
+from .utils.outbox import deliver_outbox, get_retry_delay
+
+
+def record_pages(app, requests: int) -> list[bytes]:
+    """
+    record_pages requests result pages of the app through a RecordingTransport and returns the recorded pages
+    """
+
+    async def fetch(directory: str):
+        transport = RecordingTransport(directory, httpx.ASGITransport(app))
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://tevis.test/"
+        ) as client:
+            for index in range(requests):
+                await client.post(
+                    f"/location?cnc-{index % 3}=1", data={"loc": index % 2}
+                )
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(fetch(directory))
+        with open(pathlib.Path(directory) / RECORDS_FILE) as records_file:
+            return [
+                base64.b64decode(json.loads(line)["content"]) for line in records_file
+            ]
+
+
+def parse_appointments_stream(content: bytes, chunk_size: int = 64) -> ParseResult:
+    """
+    parse_appointments_stream parses a page with the AppointmentStreamParser in chunks of chunk_size bytes
+    """
+    parser = AppointmentStreamParser()
+    for i in range(0, len(content), chunk_size):
+        parser.feed(content[i : i + chunk_size])
+    return parser.close()
+
+
+def suggestion_form(date: str | None, start: str, end: str, classes="suggestion_form"):
+    """
+    suggestion_form renders a suggestion form like tevis, the date input has no value if date is None
+    """
+    date_input = (
+        f'<input type="hidden" name="date" value="{date}">'
+        if date is not None
+        else '<input type="hidden" name="date">'
+    )
+    return (
+        f'<form class="{classes}" method="post">{date_input}'
+        f'<input type="hidden" name="start" value="{start}">'
+        f'<input type="hidden" name="end" value="{end}"></form>'
+    )
+
+
+def save_scraper_run(appointment_ids: set[int]) -> ScraperRun:
+    """
+    save_scraper_run saves a completed scraper run which found the appointments like the scraper
+    """
+    previous_run = (
+        ScraperRun.objects.filter(status=ScraperRun.Status.COMPLETED)
+        .order_by("-start_time")
+        .first()
+    )
+    scraper_run = scraper.start_scraper_run()
+    scraper.update_availabilities(appointment_ids, set(), scraper_run, previous_run)
+    scraper.save_vanished(scraper_run, previous_run)
+    scraper_run.status = ScraperRun.Status.COMPLETED
+    scraper_run.save()
+    return scraper_run
+
+
+class RecordingTests(SimpleTestCase):
+    def test_concurrent_requests(self):
+        app = SyntheticTevisApp(5, latency=0.05)
+
+        async def fetch(directory: str):
+            transport = RecordingTransport(directory, httpx.ASGITransport(app))
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://tevis.test/"
+            ) as client:
+                await asyncio.gather(
+                    *[
+                        client.post(f"/location?cnc-{index}=1", data={"loc": 1})
+                        for index in range(10)
+                    ]
+                )
+
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(fetch(directory))
+            with open(pathlib.Path(directory) / RECORDS_FILE) as records_file:
+                records = [json.loads(line) for line in records_file]
+        self.assertEqual(
+            sorted(json.loads(record["key"])[2] for record in records),
+            sorted([[f"cnc-{index}", "1"]] for index in range(10)),
+        )
+
+
+class ParserTests(SimpleTestCase):
+    edge_case_pages = {
+        "extra classes": suggestion_form(
+            "20261201", "480", "495", "foo suggestion_form"
+        ),
+        "missing value": suggestion_form(None, "480", "495")
+        + suggestion_form("20261201", "500", "515"),
+        "invalid value": suggestion_form("2026-12-01", "480", "495"),
+        "inputs after empty form": '<form class="suggestion_form"></form>'
+        '<div><input name="date" value="20261201"><input name="start" value="480">'
+        '<input name="end" value="495"></div>'
+        + suggestion_form("20261202", "500", "515"),
+        "input in other form": '<form class="other"><input name="date" value="20261203"></form>'
+        '<form class="suggestion_form"><input name="start" value="480"><input name="end" value="495"></form>'
+        '<input name="date" value="20261204">',
+        "no inputs": '<form class="suggestion_form"></form>',
+    }
+
+    def assertParsersAgree(self, content: bytes):
+        lxml_result = parse_appointments_lxml(content)
+        for result in (
+            parse_appointments_soup(content),
+            parse_appointments_stream(content),
+        ):
+            self.assertEqual(result.appointments, lxml_result.appointments)
+            self.assertEqual(
+                len(result.invalid_elements), len(lxml_result.invalid_elements)
+            )
+        return lxml_result
+
+    def test_recorded_pages(self):
+        pages = record_pages(SyntheticTevisApp(40), 6)
+        self.assertEqual(len(pages), 6)
+        for page in pages:
+            with self.subTest(page=page[:100]):
+                result = self.assertParsersAgree(page)
+                self.assertEqual(len(result.appointments), 40)
+                self.assertEqual(result.invalid_elements, [])
+
+    def test_edge_cases(self):
+        for name, forms in self.edge_case_pages.items():
+            with self.subTest(name):
+                self.assertParsersAgree(
+                    f"<!DOCTYPE html><html><body>{forms}</body></html>".encode()
+                )
+
+    def test_soup_parser_edge_cases(self):
+        def parse(name):
+            return parse_appointments_soup(
+                f"<html><body>{self.edge_case_pages[name]}</body></html>".encode()
+            )
+
+        self.assertEqual(len(parse("extra classes").appointments), 1)
+        result = parse("missing value")
+        self.assertEqual(len(result.appointments), 1)
+        self.assertEqual(len(result.invalid_elements), 1)
+        self.assertEqual(
+            [
+                appointment.date.day
+                for appointment in parse("inputs after empty form").appointments
+            ],
+            [1, 2],
+        )
+
+
+@override_settings(
+    DARMSTADT_TERMINE_SCRAPER_POLL_INTERVAL_MIN=0,
+    DARMSTADT_TERMINE_SCRAPER_POLL_INTERVAL_MAX=0,
+    DARMSTADT_TERMINE_SCRAPER_MAX_RETRIES=0,
+)
+class AvailabilityTests(TestCase):
+    slots = 10
+    # two appointment types at two locations
+    pages = 4
+
+    def setUp(self):
+        create_catalog(2, 2)
+        self.app = SyntheticTevisApp(self.slots, change_rate=0)
+
+    def scrape(self) -> ScraperRun:
+        async def run():
+            async with SessionPool(
+                "http://tevis.test/", 2, 300, transport=httpx.ASGITransport(self.app)
+            ) as session_pool:
+                await scraper.fetch_all_types(session_pool)
+
+        async_to_sync(run)()
+        return ScraperRun.objects.latest("start_time")
+
+    def assertChanges(self, scraper_run: ScraperRun, added: int, removed: int):
+        self.assertEqual(
+            AppointmentChange.objects.filter(
+                scraper_run=scraper_run, added=True
+            ).count(),
+            added,
+        )
+        self.assertEqual(
+            AppointmentChange.objects.filter(
+                scraper_run=scraper_run, added=False
+            ).count(),
+            removed,
+        )
+
+    def assertAvailableOnce(self, scraper_run: ScraperRun, appointments: int):
+        available = Availability.objects.filter(
+            first_seen_run__lte=scraper_run.pk, last_seen_run__gte=scraper_run.pk
+        )
+        self.assertEqual(available.count(), appointments)
+        self.assertFalse(
+            Availability.objects.values("appointment")
+            .annotate(intervals=Count("pk"))
+            .filter(intervals__gt=1)
+            .exists()
+        )
+
+    def test_first_run(self):
+        scraper_run = self.scrape()
+        self.assertEqual(scraper_run.status, ScraperRun.Status.COMPLETED)
+        self.assertEqual(scraper_run.slots_new, self.pages * self.slots)
+        self.assertChanges(scraper_run, self.pages * self.slots, 0)
+        self.assertAvailableOnce(scraper_run, self.pages * self.slots)
+
+    def test_unchanged_responses(self):
+        first_run = self.scrape()
+        second_run = self.scrape()
+        self.assertChanges(second_run, 0, 0)
+        self.assertEqual(
+            Availability.objects.filter(
+                first_seen_run=first_run, last_seen_run=second_run
+            ).count(),
+            self.pages * self.slots,
+        )
+
+    def test_changed_responses(self):
+        first_run = self.scrape()
+        self.app.change_rate = 1
+        second_run = self.scrape()
+        # the first appointment of every page vanished and a new one was added at the end
+        self.assertChanges(second_run, self.pages, self.pages)
+        self.assertEqual(
+            Availability.objects.filter(last_seen_run=first_run).count(), self.pages
+        )
+        self.assertAvailableOnce(second_run, self.pages * self.slots)
+        self.assertEqual(
+            (second_run.slots_new, second_run.slots_removed), (self.pages, self.pages)
+        )
+
+    @override_settings(
+        DARMSTADT_TERMINE_SCRAPER_POLL_INTERVAL_MIN=3600,
+        DARMSTADT_TERMINE_SCRAPER_POLL_INTERVAL_MAX=3600,
+    )
+    def test_skipped_requests(self):
+        self.scrape()
+        requests = self.app.requests
+        self.app.change_rate = 1
+        second_run = self.scrape()
+        third_run = self.scrape()
+        self.assertEqual(self.app.requests, requests)
+        self.assertChanges(third_run, 0, 0)
+        self.assertAvailableOnce(third_run, self.pages * self.slots)
+        self.assertEqual(
+            Availability.objects.filter(last_seen_run=second_run).count(), 0
+        )
+
+    def test_failed_requests(self):
+        self.scrape()
+        self.app.error_rate = 1
+        with self.assertLogs("darmstadt_termine.scraper", "WARNING"):
+            second_run = self.scrape()
+        self.assertEqual(second_run.status, ScraperRun.Status.COMPLETED)
+        self.assertGreater(second_run.errors, 0)
+        # the appointments of the previous scraper run are kept
+        self.assertChanges(second_run, 0, 0)
+        self.assertAvailableOnce(second_run, self.pages * self.slots)
+
+    def test_failed_summary_mail(self):
+        self.scrape()
+        self.app.error_rate = 1
+        with mock.patch(
+            "darmstadt_termine.utils.errors.mail_admins",
+            side_effect=OSError("smtp down"),
+        ), self.assertLogs("darmstadt_termine.scraper", "ERROR") as logs:
+            second_run = self.scrape()
+        self.assertEqual(second_run.status, ScraperRun.Status.COMPLETED)
+        self.assertIn("smtp down", "\n".join(logs.output))
+
+    def test_failed_run(self):
+        first_run = self.scrape()
+        self.app.change_rate = 1
+        with mock.patch.object(
+            scraper, "save_vanished", side_effect=RuntimeError("crash")
+        ):
+            with self.assertRaises(RuntimeError):
+                self.scrape()
+        failed_run = ScraperRun.objects.latest("start_time")
+        self.assertEqual(failed_run.status, ScraperRun.Status.FAILED)
+        self.assertChanges(failed_run, self.pages, 0)
+
+        third_run = self.scrape()
+        # the third run continues from the first run, the availabilities extended by the failed run are not duplicated
+        self.assertEqual(third_run.status, ScraperRun.Status.COMPLETED)
+        self.assertAvailableOnce(third_run, self.pages * self.slots)
+        self.assertChanges(third_run, self.pages, 2 * self.pages)
+        self.assertEqual(
+            Availability.objects.filter(
+                first_seen_run=first_run, last_seen_run=third_run
+            ).count(),
+            self.pages * (self.slots - 2),
+        )
+
+    def test_only_one_running_run(self):
+        running_run = ScraperRun.objects.create()
+        with self.assertRaises(scraper.ScraperRunInProgress):
+            self.scrape()
+
+        ScraperRun.objects.filter(pk=running_run.pk).update(
+            start_time=timezone.now() - datetime.timedelta(hours=2)
+        )
+        self.assertEqual(self.scrape().status, ScraperRun.Status.COMPLETED)
+        running_run.refresh_from_db()
+        self.assertEqual(running_run.status, ScraperRun.Status.FAILED)
+
+
+class PollingTests(SimpleTestCase):
+    minimum = datetime.timedelta(minutes=1)
+    maximum = datetime.timedelta(hours=1)
+
+    def next_interval(self, interval, changed):
+        return next_poll_interval(
+            interval, changed, self.minimum, self.maximum, factor=1.5
+        )
+
+    def test_next_poll_interval(self):
+        self.assertEqual(self.next_interval(None, False), self.minimum)
+        self.assertEqual(
+            self.next_interval(datetime.timedelta(minutes=10), False),
+            datetime.timedelta(minutes=15),
+        )
+        self.assertEqual(
+            self.next_interval(datetime.timedelta(minutes=10), True),
+            datetime.timedelta(minutes=5),
+        )
+        self.assertEqual(
+            self.next_interval(datetime.timedelta(minutes=50), False), self.maximum
+        )
+        self.assertEqual(
+            self.next_interval(datetime.timedelta(minutes=1), True), self.minimum
+        )
+
+    def test_is_due(self):
+        now = timezone.now()
+        self.assertTrue(is_due(None, now, quiet=False))
+        self.assertTrue(is_due(None, now, quiet=True))
+        self.assertTrue(is_due(now - datetime.timedelta(seconds=1), now, quiet=False))
+        self.assertTrue(is_due(now + POLL_TOLERANCE, now, quiet=False))
+        self.assertFalse(
+            is_due(now + 2 * POLL_TOLERANCE, now, quiet=False),
+        )
+        self.assertFalse(is_due(now - datetime.timedelta(hours=1), now, quiet=True))
+
+
+class AdaptiveLimitTests(SimpleTestCase):
+    def test_increase(self):
+        limit = AdaptiveLimit(initial=4, minimum=1, maximum=6)
+        for _ in range(4):
+            limit.record_success(0.1)
+        self.assertAlmostEqual(limit.limit, 5, delta=0.1)
+        for _ in range(100):
+            limit.record_success(0.1)
+        self.assertEqual(limit.limit, 6)
+
+    def test_no_increase_while_latency_is_high(self):
+        limit = AdaptiveLimit(initial=4, minimum=1, maximum=16)
+        for _ in range(10):
+            limit.record_success(0.1)
+        increased_limit = limit.limit
+        for _ in range(5):
+            limit.record_success(10)
+        self.assertLessEqual(limit.limit, increased_limit + 1 / increased_limit)
+
+    def test_decrease(self):
+        limit = AdaptiveLimit(initial=8, minimum=3, maximum=16)
+        start_time = time.monotonic()
+        limit.record_congestion(start_time)
+        self.assertEqual(limit.limit, 4)
+        # the requests in flight during the decrease do not decrease the limit again
+        limit.record_congestion(start_time)
+        self.assertEqual(limit.limit, 4)
+        limit.record_congestion(time.monotonic())
+        self.assertEqual(limit.limit, 3)
+
+
+@override_settings(
+    DARMSTADT_TERMINE_OUTBOX_MAX_ATTEMPTS=3,
+    DARMSTADT_TERMINE_OUTBOX_RETRY_BACKOFF=60,
+)
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.outbox_message = OutboxMessage.objects.create(
+            email="test@example.com", subject="Neue Termine", body="Termine"
+        )
+
+    def deliver_failing(self):
+        with mock.patch.object(
+            EmailBackend, "send_messages", side_effect=OSError("smtp down")
+        ), self.assertLogs("darmstadt_termine.utils.outbox", "WARNING"):
+            result = deliver_outbox()
+        self.outbox_message.refresh_from_db()
+        return result
+
+    def make_due(self):
+        OutboxMessage.objects.update(next_attempt=timezone.now())
+
+    def test_delivery(self):
+        result = deliver_outbox()
+        self.assertEqual((result.sent, result.failed, result.given_up), (1, 0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["test@example.com"])
+        self.outbox_message.refresh_from_db()
+        self.assertIsNotNone(self.outbox_message.sent)
+        self.assertEqual(self.outbox_message.claim, "")
+        # a sent email is not delivered again
+        self.assertEqual(deliver_outbox().sent, 0)
+
+    def test_retry_with_backoff(self):
+        start_time = timezone.now()
+        result = self.deliver_failing()
+        self.assertEqual((result.sent, result.failed, result.given_up), (0, 1, 0))
+        self.assertEqual(self.outbox_message.attempts, 1)
+        self.assertEqual(self.outbox_message.last_error, "smtp down")
+        self.assertGreaterEqual(
+            self.outbox_message.next_attempt, start_time + get_retry_delay(1)
+        )
+        # the email is not retried before it is due
+        self.assertEqual(deliver_outbox().sent, 0)
+
+        self.make_due()
+        start_time = timezone.now()
+        self.deliver_failing()
+        self.assertEqual(self.outbox_message.attempts, 2)
+        self.assertEqual(get_retry_delay(2), 2 * get_retry_delay(1))
+        self.assertGreaterEqual(
+            self.outbox_message.next_attempt, start_time + get_retry_delay(2)
+        )
+
+        self.make_due()
+        result = deliver_outbox()
+        self.assertEqual(result.sent, 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_give_up(self):
+        for _ in range(2):
+            self.deliver_failing()
+            self.make_due()
+        result = self.deliver_failing()
+        self.assertEqual((result.sent, result.failed, result.given_up), (0, 0, 1))
+        self.make_due()
+        self.assertEqual(deliver_outbox().sent, 0)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_claimed_email_is_skipped(self):
+        OutboxMessage.objects.update(
+            claim="other", next_attempt=timezone.now() + datetime.timedelta(minutes=5)
+        )
+        self.assertEqual(deliver_outbox().sent, 0)
+        # the claim of a process which died expires
+        self.make_due()
+        self.assertEqual(deliver_outbox().sent, 1)
+
+
+class NotificationTests(TestCase):
+    def setUp(self):
+        create_catalog(2, 2)
+        self.appointment_types = list(AppointmentType.objects.order_by("index"))
+        self.location = Location.objects.order_by("index").first()
+        self.day = timezone.localdate() + datetime.timedelta(days=30)
+        # the links of the emails contain tokens with the current time, the emails of different dispatches are compared
+        token_timestamp = mock.patch.object(
+            OneTimeTokenGenerator, "_get_current_timestamp", return_value=0
+        )
+        token_timestamp.start()
+        self.addCleanup(token_timestamp.stop)
+
+    def create_appointments(
+        self, appointment_type: AppointmentType, count: int, day_offset: int = 0
+    ) -> set[int]:
+        return {
+            Appointment.objects.create(
+                appointment_type=appointment_type,
+                location=self.location,
+                date=self.day + datetime.timedelta(days=day_offset),
+                start_time=datetime.time(8, index),
+                end_time=datetime.time(8, index + 1),
+            ).pk
+            for index in range(count)
+        }
+
+    def create_notification(
+        self,
+        email: str,
+        appointment_types: list[AppointmentType],
+        language: str = "de",
+        last_notified_run: ScraperRun | None = None,
+    ) -> Notification:
+        notification = Notification.objects.create(
+            email=email,
+            language=language,
+            last_notified_run=last_notified_run,
+            active=True,
+            confirmed=True,
+        )
+        notification.appointment_type.set(appointment_types)
+        return notification
+
+    def send_notifications(self, *args: str) -> dict[str, OutboxMessage]:
+        OutboxMessage.objects.all().delete()
+        call_command(
+            "send_notifications", "--enqueue-only", *args, stdout=io.StringIO()
+        )
+        return {
+            outbox_message.email: outbox_message
+            for outbox_message in OutboxMessage.objects.all()
+        }
+
+    def test_workers(self):
+        save_scraper_run(self.create_appointments(self.appointment_types[0], 3))
+        for index in range(4):
+            self.create_notification(
+                f"test{index}@example.com",
+                self.appointment_types,
+                language=("de", "en")[index % 2],
+            )
+        expected = self.send_notifications("--no-update")
+        self.assertEqual(len(expected), 4)
+
+        # the worker processes have to work with every start method, not only if they are forked
+        for start_method in multiprocessing.get_all_start_methods():
+            with self.subTest(start_method), mock.patch.object(
+                send_notifications, "RENDER_BATCH_SIZE", 1
+            ), mock.patch.object(
+                concurrent.futures,
+                "ProcessPoolExecutor",
+                functools.partial(
+                    concurrent.futures.ProcessPoolExecutor,
+                    mp_context=multiprocessing.get_context(start_method),
+                ),
+            ):
+                outbox_messages = self.send_notifications(
+                    "--no-update", "--workers", "2"
+                )
+                self.assertEqual(outbox_messages.keys(), expected.keys())
+                for email, outbox_message in outbox_messages.items():
+                    self.assertEqual(
+                        (
+                            outbox_message.subject,
+                            outbox_message.body,
+                            outbox_message.html_body,
+                        ),
+                        (
+                            expected[email].subject,
+                            expected[email].body,
+                            expected[email].html_body,
+                        ),
+                    )
+
+    def get_appointment_tuples(
+        self, appointment_ids: set[int]
+    ) -> set[AppointmentTuple]:
+        return {
+            AppointmentTuple(
+                appointment.start_time,
+                appointment.end_time,
+                appointment.date,
+                appointment.appointment_type_id,
+                appointment.location.name,
+            )
+            for appointment in Appointment.objects.filter(
+                pk__in=appointment_ids
+            ).select_related("location")
+        }
+
+    def test_last_notified_runs_and_languages(self):
+        first_type, second_type = self.appointment_types
+        old_appointments = self.create_appointments(first_type, 3)
+        first_run = save_scraper_run(old_appointments)
+        new_appointments = self.create_appointments(first_type, 2, day_offset=1)
+        other_appointments = self.create_appointments(second_type, 1)
+        second_run = save_scraper_run(
+            old_appointments | new_appointments | other_appointments
+        )
+
+        expected_appointments = {
+            self.create_notification(
+                "first@example.com", [first_type], last_notified_run=first_run
+            ): new_appointments,
+            self.create_notification(
+                "both@example.com",
+                self.appointment_types,
+                language="en",
+                last_notified_run=first_run,
+            ): new_appointments
+            | other_appointments,
+            self.create_notification("new@example.com", [first_type]): old_appointments
+            | new_appointments,
+            # shares the rendered section of the first appointment type with first@example.com
+            self.create_notification(
+                "both-de@example.com",
+                self.appointment_types,
+                last_notified_run=first_run,
+            ): new_appointments
+            | other_appointments,
+        }
+        notified = self.create_notification(
+            "notified@example.com", self.appointment_types, last_notified_run=second_run
+        )
+
+        outbox_messages = self.send_notifications("--no-update")
+        self.assertEqual(
+            outbox_messages.keys(),
+            {notification.email for notification in expected_appointments},
+        )
+        for notification, appointment_ids in expected_appointments.items():
+            # the sections rendered once per dispatch are the same as the ones rendered for a single notification
+            email_message = create_notification_email_message_for_new_appointments(
+                notification, self.get_appointment_tuples(appointment_ids), "https"
+            )
+            outbox_message = outbox_messages[notification.email]
+            self.assertEqual(outbox_message.body, email_message.body)
+            self.assertEqual(outbox_message.html_body, email_message.alternatives[0][0])
+        self.assertNotEqual(
+            outbox_messages["both@example.com"].body,
+            outbox_messages["both-de@example.com"].body,
+        )
+
+        notified.refresh_from_db()
+        self.assertEqual(notified.last_notified_run, second_run)
+        for notification in expected_appointments:
+            last_notified_run_id = notification.last_notified_run_id
+            notification.refresh_from_db()
+            self.assertEqual(notification.last_notified_run_id, last_notified_run_id)
+
+    def test_subscribed_notifications(self):
+        first_type, second_type = self.appointment_types
+        first = self.create_notification("first@example.com", [first_type])
+        both = self.create_notification("both@example.com", self.appointment_types)
+        self.create_notification("none@example.com", [])
+        self.assertEqual(
+            send_notifications.get_notifications_by_appointment_type(
+                Notification.objects.all()
+            ),
+            {first_type.pk: [first.pk, both.pk], second_type.pk: [both.pk]},
+        )
+
+        save_scraper_run(self.create_appointments(second_type, 2))
+        self.assertEqual(self.send_notifications().keys(), {"both@example.com"})
+
+    def test_update(self):
+        old_appointments = self.create_appointments(self.appointment_types[0], 2)
+        first_run = save_scraper_run(old_appointments)
+        notification = self.create_notification(
+            "test@example.com", self.appointment_types
+        )
+        self.assertEqual(len(self.send_notifications()), 1)
+        notification.refresh_from_db()
+        self.assertEqual(notification.last_notified_run, first_run)
+        self.assertGreater(notification.last_sent, first_run.start_time)
+
+        # after the minimum wait time the notification only gets the appointments added after the first run
+        Notification.objects.update(
+            last_sent=timezone.now() - 2 * notification.minimum_waittime
+        )
+        self.assertEqual(len(self.send_notifications()), 0)
+        new_appointments = self.create_appointments(self.appointment_types[0], 1, 1)
+        save_scraper_run(old_appointments | new_appointments)
+        notification.refresh_from_db()
+        self.assertEqual(
+            self.send_notifications()["test@example.com"].body,
+            create_notification_email_message_for_new_appointments(
+                notification, self.get_appointment_tuples(new_appointments), "https"
+            ).body,
+        )
+
+    def test_delivery(self):
+        save_scraper_run(self.create_appointments(self.appointment_types[0], 2))
+        self.create_notification("test@example.com", self.appointment_types)
+        self.send_notifications("--no-update")
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertFalse(OutboxMessage.objects.filter(sent__isnull=False).exists())
+
+        OutboxMessage.objects.all().delete()
+        call_command("send_notifications", stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["test@example.com"])
+        self.assertIsNotNone(OutboxMessage.objects.get().sent)
+
+
+class CompactHistoryTests(TestCase):
+    def setUp(self):
+        create_catalog(1, 1)
+        self.appointment_type = AppointmentType.objects.get()
+        self.location = Location.objects.get()
+        day = timezone.localdate() + datetime.timedelta(days=30)
+        self.appointments = [
+            Appointment.objects.create(
+                appointment_type=self.appointment_type,
+                location=self.location,
+                date=day,
+                start_time=datetime.time(8, index),
+                end_time=datetime.time(8, index + 1),
+            ).pk
+            for index in range(4)
+        ]
+
+    def save_scraper_run(self, appointments: int, days_ago: int) -> ScraperRun:
+        scraper_run = save_scraper_run(set(self.appointments[:appointments]))
+        ScraperRun.objects.filter(pk=scraper_run.pk).update(
+            start_time=timezone.now() - datetime.timedelta(days=days_ago)
+        )
+        return scraper_run
+
+    def compact_history(self):
+        call_command("compact_history", "--older-than", "5", stdout=io.StringIO())
+
+    def get_added_appointments(
+        self, scraper_run: ScraperRun, since_scraper_run: ScraperRun
+    ) -> set[int]:
+        return set(
+            get_added_appointments(scraper_run, since_scraper_run).values_list(
+                "pk", flat=True
+            )
+        )
+
+    def test_compact(self):
+        self.save_scraper_run(2, days_ago=10)
+        self.save_scraper_run(3, days_ago=9)
+        last_run = self.save_scraper_run(4, days_ago=0)
+        self.compact_history()
+
+        self.assertEqual(list(ScraperRun.objects.all()), [last_run])
+        self.assertEqual(
+            set(get_scraper_run_appointments(last_run).values_list("pk", flat=True)),
+            set(self.appointments),
+        )
+        self.assertFalse(
+            AppointmentChange.objects.exclude(scraper_run=last_run).exists()
+        )
+        self.assertEqual(
+            sorted(
+                DailyAvailability.objects.values_list(
+                    "appointments", "appointments_added", "appointments_removed"
+                )
+            ),
+            [(2, 2, 0), (3, 1, 0)],
+        )
+
+    def test_keeps_last_completed_run(self):
+        self.save_scraper_run(2, days_ago=10)
+        completed_run = self.save_scraper_run(3, days_ago=9)
+        failed_run = self.save_scraper_run(4, days_ago=8)
+        ScraperRun.objects.filter(pk=failed_run.pk).update(
+            status=ScraperRun.Status.FAILED
+        )
+        self.compact_history()
+        self.assertEqual(list(ScraperRun.objects.all()), [completed_run, failed_run])
+
+    def test_keeps_history_after_last_notified_run(self):
+        first_run = self.save_scraper_run(2, days_ago=10)
+        notified_run = self.save_scraper_run(3, days_ago=9)
+        third_run = self.save_scraper_run(4, days_ago=8)
+        last_run = self.save_scraper_run(4, days_ago=0)
+        Notification.objects.create(
+            email="test@example.com",
+            language="de",
+            last_notified_run=notified_run,
+            active=True,
+            confirmed=True,
+        )
+        Notification.objects.create(
+            email="inactive@example.com", language="de", last_notified_run=first_run
+        )
+        self.compact_history()
+
+        # the history before the last notified scraper run of the active notification is compacted,
+        # the scraper run of the inactive notification is only kept because it is referenced
+        self.assertEqual(
+            list(ScraperRun.objects.all()),
+            [first_run, notified_run, third_run, last_run],
+        )
+        self.assertFalse(
+            AppointmentChange.objects.filter(scraper_run__lt=notified_run.pk).exists()
+        )
+        self.assertEqual(
+            self.get_added_appointments(last_run, notified_run),
+            {self.appointments[3]},
+        )
+
+
+class MigrationTestCase(TransactionTestCase):
+    """
+    MigrationTestCase migrates the app back to migrate_from, creates the rows of setUpBeforeMigration with the historical models
+    and migrates to migrate_to. The historical models after the migration are available as self.apps.
+    """
+
+    migrate_from: str
+    migrate_to: str
+
+    def migrate(self, migration: str):
+        executor = MigrationExecutor(connection)
+        target = [("darmstadt_termine", migration)]
+        executor.migrate(target)
+        return executor.loader.project_state(target).apps
+
+    def setUp(self):
+        self.setUpBeforeMigration(self.migrate(self.migrate_from))
+        self.apps = self.migrate(self.migrate_to)
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def setUpBeforeMigration(self, apps):
+        pass
+
+    def create_appointment_type(self, apps):
+        Department = apps.get_model("darmstadt_termine", "Department")
+        AppointmentCategory = apps.get_model("darmstadt_termine", "AppointmentCategory")
+        AppointmentType = apps.get_model("darmstadt_termine", "AppointmentType")
+        Location = apps.get_model("darmstadt_termine", "Location")
+        department = Department.objects.create(name="Bürgerbüro", index=1)
+        appointment_category = AppointmentCategory.objects.create(
+            name="Ausweise", index=1, department=department
+        )
+        self.location = Location.objects.create(
+            name="Luisenplatz", descriptor="Luisenplatz", index=1
+        )
+        return AppointmentType.objects.create(
+            name="Personalausweis", index=1, appointment_category=appointment_category
+        )
+
+
+class AppointmentChangeMigrationTests(MigrationTestCase):
+    migrate_from = "0030_scraperrun_bytes_fetched_scraperrun_db_time_and_more"
+    migrate_to = "0034_notification_last_notified_run"
+
+    def setUpBeforeMigration(self, apps):
+        ScraperRun = apps.get_model("darmstadt_termine", "ScraperRun")
+        Appointment = apps.get_model("darmstadt_termine", "Appointment")
+        Availability = apps.get_model("darmstadt_termine", "Availability")
+        Notification = apps.get_model("darmstadt_termine", "Notification")
+
+        now = timezone.now()
+        self.runs = [ScraperRun.objects.create() for _ in range(3)]
+        for index, scraper_run in enumerate(self.runs):
+            ScraperRun.objects.filter(pk=scraper_run.pk).update(
+                end_time=now - datetime.timedelta(hours=3 - index)
+            )
+        appointment_type = self.create_appointment_type(apps)
+        self.appointments = [
+            Appointment.objects.create(
+                appointment_type=appointment_type,
+                location=self.location,
+                date=datetime.date(2026, 12, 1),
+                start_time=datetime.time(8, index),
+                end_time=datetime.time(8, index + 1),
+            )
+            for index in range(3)
+        ]
+        first_run, second_run, third_run = self.runs
+        for appointment, first_seen_run, last_seen_run in (
+            (self.appointments[0], first_run, third_run),
+            (self.appointments[1], first_run, first_run),
+            (self.appointments[2], second_run, third_run),
+        ):
+            Availability.objects.create(
+                appointment=appointment,
+                first_seen_run=first_seen_run,
+                last_seen_run=last_seen_run,
+            )
+        # the notification was sent after the first scraper run
+        self.notification = Notification.objects.create(
+            email="test@example.com",
+            language="de",
+            last_sent=now - datetime.timedelta(hours=2, minutes=30),
+        )
+
+    def test_appointment_changes(self):
+        AppointmentChange = self.apps.get_model(
+            "darmstadt_termine", "AppointmentChange"
+        )
+        first_run, second_run, _ = self.runs
+        self.assertEqual(
+            set(
+                AppointmentChange.objects.values_list(
+                    "appointment", "scraper_run", "added"
+                )
+            ),
+            {
+                (self.appointments[0].pk, first_run.pk, True),
+                (self.appointments[1].pk, first_run.pk, True),
+                (self.appointments[1].pk, second_run.pk, False),
+                (self.appointments[2].pk, second_run.pk, True),
+            },
+        )
+
+    def test_added_after_last_notified_run(self):
+        Notification = self.apps.get_model("darmstadt_termine", "Notification")
+        AppointmentChange = self.apps.get_model(
+            "darmstadt_termine", "AppointmentChange"
+        )
+        last_notified_run = Notification.objects.get().last_notified_run
+        self.assertEqual(last_notified_run.pk, self.runs[0].pk)
+        self.assertEqual(
+            set(
+                AppointmentChange.objects.filter(
+                    scraper_run__gt=last_notified_run, added=True
+                ).values_list("appointment", flat=True)
+            ),
+            {self.appointments[2].pk},
+        )
+
+
+class DeduplicateAppointmentsMigrationTests(MigrationTestCase):
+    migrate_from = "0032_dailyavailability"
+    migrate_to = "0033_appointment_unique_appointment"
+
+    def setUpBeforeMigration(self, apps):
+        ScraperRun = apps.get_model("darmstadt_termine", "ScraperRun")
+        Appointment = apps.get_model("darmstadt_termine", "Appointment")
+        Availability = apps.get_model("darmstadt_termine", "Availability")
+        AppointmentChange = apps.get_model("darmstadt_termine", "AppointmentChange")
+
+        self.runs = [ScraperRun.objects.create().pk for _ in range(6)]
+        appointment_type = self.create_appointment_type(apps)
+
+        def create_appointment(location, start_time=datetime.time(8)):
+            return Appointment.objects.create(
+                appointment_type=appointment_type,
+                location=location,
+                date=datetime.date(2026, 12, 1),
+                start_time=start_time,
+                end_time=datetime.time(9),
+            ).pk
+
+        self.kept, duplicate, adjacent_duplicate = (
+            create_appointment(self.location) for _ in range(3)
+        )
+        self.unique = create_appointment(self.location, datetime.time(8, 30))
+        # appointments without location are never equal
+        self.without_location = {create_appointment(None) for _ in range(2)}
+
+        r1, r2, r3, r4, r5, r6 = self.runs
+        for appointment, first_seen_run, last_seen_run in (
+            (self.kept, r1, r2),
+            # overlaps the first availability of the kept appointment
+            (duplicate, r2, r3),
+            # starts in the scraper run after the end of the duplicate
+            (adjacent_duplicate, r4, r4),
+            (self.kept, r6, r6),
+            (duplicate, r6, r6),
+            (self.unique, r1, r6),
+        ):
+            Availability.objects.create(
+                appointment_id=appointment,
+                first_seen_run_id=first_seen_run,
+                last_seen_run_id=last_seen_run,
+            )
+        for appointment, scraper_run, added in (
+            (self.kept, r1, True),
+            (self.kept, r3, False),
+            (duplicate, r2, True),
+            (duplicate, r4, False),
+            (adjacent_duplicate, r4, True),
+            (adjacent_duplicate, r5, False),
+            (self.kept, r6, True),
+            (duplicate, r6, True),
+            (self.unique, r1, True),
+        ):
+            AppointmentChange.objects.create(
+                appointment_id=appointment, scraper_run_id=scraper_run, added=added
+            )
+
+    def test_deduplicate_appointments(self):
+        Appointment = self.apps.get_model("darmstadt_termine", "Appointment")
+        Availability = self.apps.get_model("darmstadt_termine", "Availability")
+        AppointmentChange = self.apps.get_model(
+            "darmstadt_termine", "AppointmentChange"
+        )
+        r1, r2, r3, r4, r5, r6 = self.runs
+
+        self.assertEqual(
+            set(Appointment.objects.values_list("pk", flat=True)),
+            {self.kept, self.unique} | self.without_location,
+        )
+        self.assertEqual(
+            set(
+                Availability.objects.values_list(
+                    "appointment", "first_seen_run", "last_seen_run"
+                )
+            ),
+            {(self.kept, r1, r4), (self.kept, r6, r6), (self.unique, r1, r6)},
+        )
+        # the changes within a merged availability are deleted, the duplicate changes are merged
+        self.assertEqual(
+            sorted(
+                AppointmentChange.objects.values_list(
+                    "appointment", "scraper_run", "added"
+                )
+            ),
+            sorted(
+                [
+                    (self.kept, r1, True),
+                    (self.kept, r5, False),
+                    (self.kept, r6, True),
+                    (self.unique, r1, True),
+                ]
+            ),
+        )
@@ -0,0 +1,193 @@
+import asyncio
+import contextlib
+import time
+from typing import AsyncIterator
+
+
+class AdaptiveLimit:
+    """
+    AdaptiveLimit is a concurrency limit which adapts to the upstream by additive increase and multiplicative decrease (AIMD).
+    Every successful request raises the limit by 1 / limit, that is by one per limit requests, as long as the latency stays low.
+    The latency counts as low while its short term average is at most latency_tolerance times its long term average.
+    A throttled or failed request multiplies the limit by the backoff factor.
+    The limit is only decreased once for all requests which were already in flight when it was decreased.
+    """
+
+    short_term_weight = 0.3
+    long_term_weight = 0.03
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int,
+        maximum: int,
+        backoff: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ) -> None:
+        """
+        Args:
+            initial (int): the limit to start with
+            minimum (int): the lowest limit
+            maximum (int): the highest limit
+            backoff (float, optional): the factor the limit is multiplied by if a request is throttled or fails. Defaults to 0.5.
+            latency_tolerance (float, optional): how many times the long term average latency may be exceeded while the limit is still increased.
+                Defaults to 2.0.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(min(maximum, max(minimum, initial)))
+        self.in_flight = 0
+        self._short_term_latency: float | None = None
+        self._long_term_latency: float | None = None
+        self._last_decrease = float("-inf")
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _record_latency(self, latency: float):
+        if self._short_term_latency is None:
+            self._short_term_latency = self._long_term_latency = latency
+            return
+        self._short_term_latency += self.short_term_weight * (
+            latency - self._short_term_latency
+        )
+        self._long_term_latency += self.long_term_weight * (
+            latency - self._long_term_latency
+        )
+
+    def record_success(self, latency: float):
+        """
+        record_success raises the limit if the latency is low
+
+        Args:
+            latency (float): the seconds the request took
+        """
+        self._record_latency(latency)
+        if self._short_term_latency <= self.latency_tolerance * self._long_term_latency:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def record_congestion(self, start_time: float):
+        """
+        record_congestion decreases the limit, unless it was already decreased after the request was started
+
+        Args:
+            start_time (float): the time.monotonic() the request was started at
+        """
+        if start_time < self._last_decrease:
+            return
+        self.limit = max(self.minimum, self.limit * self.backoff)
+        self._last_decrease = time.monotonic()
+
+
+class RequestSlot:
+    """
+    RequestSlot is the permission to send one request.
+    If the request was throttled by the upstream, throttled has to be called, so that the limit is decreased.
+    """
+
+    def __init__(self) -> None:
+        self.start_time = time.monotonic()
+        self.congested = False
+
+    def throttled(self):
+        self.congested = True
+
+
+class RequestScheduler:
+    """
+    RequestScheduler limits how many requests may be in flight at the same time.
+    There is a fixed global limit for all requests and an adaptive limit per host, see AdaptiveLimit.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_concurrency_per_host: int,
+        min_concurrency_per_host: int = 1,
+        initial_concurrency_per_host: int | None = None,
+    ) -> None:
+        """
+        Args:
+            max_concurrency (int): the maximum amount of concurrent requests overall
+            max_concurrency_per_host (int): the maximum amount of concurrent requests to a single host
+            min_concurrency_per_host (int, optional): the amount of concurrent requests to a single host the limit never goes below. Defaults to 1.
+            initial_concurrency_per_host (int | None, optional): the amount of concurrent requests to a single host to start with.
+                Defaults to None, which starts with the maximum.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.min_concurrency_per_host = min_concurrency_per_host
+        self.initial_concurrency_per_host = (
+            initial_concurrency_per_host or max_concurrency_per_host
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._host_limits: dict[str, AdaptiveLimit] = {}
+
+    def get_host_limit(self, host: str) -> AdaptiveLimit:
+        if host not in self._host_limits:
+            self._host_limits[host] = AdaptiveLimit(
+                self.initial_concurrency_per_host,
+                self.min_concurrency_per_host,
+                self.max_concurrency_per_host,
+            )
+        return self._host_limits[host]
+
+    @contextlib.asynccontextmanager
+    async def limit(self, host: str) -> AsyncIterator[RequestSlot]:
+        """
+        limit waits until a request to the host may be sent and holds the slot until the context exits.
+        If the context exits with an exception or the request was marked as throttled, the limit of the host is decreased,
+        otherwise it is increased depending on the latency.
+
+        Args:
+            host (str): the host the request is sent to
+
+        Yields:
+            RequestSlot: the slot of the request
+        """
+        host_limit = self.get_host_limit(host)
+        # the host slot is acquired first so that waiting for a busy host does not block other hosts
+        await host_limit.acquire()
+        try:
+            async with self._semaphore:
+                slot = RequestSlot()
+                try:
+                    yield slot
+                except Exception:
+                    slot.throttled()
+                    raise
+                finally:
+                    if slot.congested:
+                        host_limit.record_congestion(slot.start_time)
+                    else:
+                        host_limit.record_success(time.monotonic() - slot.start_time)
+        finally:
+            await host_limit.release()
+
+
+async def gather_or_cancel(*coroutines):
+    """
+    gather_or_cancel runs the coroutines concurrently like asyncio.gather,
+    but if one of them fails the others are cancelled instead of being left running
+
+    Returns:
+        list: the results of the coroutines
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
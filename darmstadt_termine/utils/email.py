@@ -1,4 +1,5 @@
 import datetime
+from typing import NamedTuple, TypedDict
 
 from django.core import mail
 from django.template import loader
@@ -7,35 +8,49 @@ from django.utils.http import urlsafe_base64_encode
 from django.utils.translation import gettext_lazy as _
 
 from ..conf import settings
-from ..models import Appointment, Notification, ScraperRun
+from ..models import AppointmentType, Notification
 from ..tokens import notification_delete_token_generator
 from .models import (
-    APPOINTMENT_TIME_FILTER,
     AppointmentTuple,
-    AppointmentTypeDict,
-    create_appointment_type_list_from_list,
     filter_appointments_by_type,
 )
 from .site import get_site_name_domain
 
 
-def create_notification_email_message(
+class AppointmentTypeBlock(TypedDict):
+    name: str
+    appointment_category: str
+    text: str
+    html: str
+
+
+class NotificationEmailPayload(NamedTuple):
+    """
+    NotificationEmailPayload holds everything needed to render a notification email without database access,
+    so that it can be sent to a worker process.
+    """
+
+    email: str
+    context: dict
+
+
+def create_notification_email_payload(
     protocol: str,
     notification: Notification,
     appointments_count: int,
-    appointment_types_list: list[AppointmentTypeDict],
-) -> mail.EmailMultiAlternatives:
+    appointment_types_list: list[AppointmentTypeBlock],
+) -> NotificationEmailPayload:
     """
-    create_notification_email_message creates an email message with the notification templates
+    create_notification_email_payload creates the template context of a notification email
 
     Args:
         protocol (str): the protocol to use for the links
         notification (Notification): the notification to send the email to
         appointments_count (int): the amount of appointments that are available
-        appointment_types_list (list[AppointmentTypeDict]): the list of appointments sorted by type
+        appointment_types_list (list[AppointmentTypeBlock]): the rendered sections of the appointment types sorted by category
 
     Returns:
-        mail.EmailMultiAlternatives: the email message
+        NotificationEmailPayload: the payload of the email
     """
     site_name, domain = get_site_name_domain()
     context = {
@@ -49,14 +64,54 @@ def create_notification_email_message(
         "idb64": urlsafe_base64_encode(force_bytes(notification.pk)),
         "timeout": datetime.timedelta(seconds=settings.DARMSTADT_TERMINE_RESET_TIMEOUT),
     }
+    return NotificationEmailPayload(notification.email, context)
+
 
+def render_notification_email(
+    payload: NotificationEmailPayload,
+) -> mail.EmailMultiAlternatives:
+    """
+    render_notification_email renders a notification email with the notification templates,
+    it does not access the database and can run in a worker process
+
+    Args:
+        payload (NotificationEmailPayload): the payload of the email
+
+    Returns:
+        mail.EmailMultiAlternatives: the email message
+    """
     return create_template_mail(
         _("Neue Termine für das Bürgerbüro Darmstadt verfügbar!"),
         "darmstadt_termine/email/notification_email_body.txt",
         "darmstadt_termine/email/notification_email_body.html",
-        context,
+        payload.context,
         None,
-        notification.email,
+        payload.email,
+    )
+
+
+def create_notification_email_message(
+    protocol: str,
+    notification: Notification,
+    appointments_count: int,
+    appointment_types_list: list[AppointmentTypeBlock],
+) -> mail.EmailMultiAlternatives:
+    """
+    create_notification_email_message creates an email message with the notification templates
+
+    Args:
+        protocol (str): the protocol to use for the links
+        notification (Notification): the notification to send the email to
+        appointments_count (int): the amount of appointments that are available
+        appointment_types_list (list[AppointmentTypeBlock]): the rendered sections of the appointment types sorted by category
+
+    Returns:
+        mail.EmailMultiAlternatives: the email message
+    """
+    return render_notification_email(
+        create_notification_email_payload(
+            protocol, notification, appointments_count, appointment_types_list
+        )
     )
 
 
@@ -92,88 +147,136 @@ def create_template_mail(
     return email_message
 
 
-def create_notification_email_message_for_new_appointments(
+def render_appointment_type_block(
+    appointment_type: AppointmentType,
+    appointments: list[AppointmentTuple],
+    language: str,
+) -> AppointmentTypeBlock:
+    """
+    render_appointment_type_block renders the section of a notification email listing the appointments of an appointment type
+
+    Args:
+        appointment_type (AppointmentType): the appointment type with its category
+        appointments (list[AppointmentTuple]): the appointments sorted by date and start time
+        language (str): the language of the email
+
+    Returns:
+        AppointmentTypeBlock: the rendered section
+    """
+    context = {
+        "appointment_type": {
+            "name": appointment_type.name,
+            "appointments": appointments,
+        },
+        "email_language": language,
+    }
+    return {
+        "name": appointment_type.name,
+        "appointment_category": appointment_type.appointment_category.name,
+        "text": loader.render_to_string(
+            "darmstadt_termine/include/notification_appointment_type.txt", context
+        ),
+        "html": loader.render_to_string(
+            "darmstadt_termine/include/notification_appointment_type.html", context
+        ),
+    }
+
+
+def create_notification_email_payload_for_new_appointments(
     notification: Notification,
-    last_scraper_run: ScraperRun,
-    last_found_appointments: set[AppointmentTuple],
     new_appointments: set[AppointmentTuple],
     protocol: str,
-) -> None | mail.EmailMultiAlternatives:
+    block_cache: dict[tuple, AppointmentTypeBlock] | None = None,
+) -> None | NotificationEmailPayload:
     """
-    create_notification_email_message_for_new_appointments creates an email message for a notification with the correct appointments
+    create_notification_email_payload_for_new_appointments creates the payload of an email for a notification with the correct appointments.
+    The sections of the appointment types are rendered once per appointment type, language and last notified scraper run
+    and reused from the block_cache for the other notifications, only the personal parts are rendered per notification.
 
     Args:
         notification (Notification): the notification to create the email for
-        last_scraper_run (ScraperRun): the last scraper run
-        last_found_appointments (set[AppointmentTuple]): the appointments found in the last scraper run
-        new_appointments (set[AppointmentTuple]): the new appointments found in the last scraper run
+        new_appointments (set[AppointmentTuple]): the appointments found since the last notified scraper run of the notification,
+            see get_appointments_since
         protocol (str): the protocol to use for the links
+        block_cache (dict[tuple, AppointmentTypeBlock] | None, optional): the rendered sections of the current dispatch.
+            Defaults to None, which renders all sections.
 
     Returns:
-        None | mail.EmailMultiAlternatives: the email message or None if no new appointments were found
+        None | NotificationEmailPayload: the payload of the email or None if no new appointments were found
     """
-    appointment_types = notification.appointment_type.all()
-    appointment_types_to_category = {}
-    for appointment_type in appointment_types:
-        appointment_types_to_category[appointment_type.pk] = (
-            appointment_type.appointment_category.pk
-        )
-
-    try:
-        last_sent_scraper_run = (
-            ScraperRun.objects.filter(end_time__lt=notification.last_sent)
-            .prefetch_related("appointments")
-            .latest("start_time")
-        )
-
-        if last_sent_scraper_run == last_scraper_run:
-            return None
-
-        last_sent_appointments = set(
-            last_sent_scraper_run.appointments.filter(
-                appointment_type__in=appointment_types, *APPOINTMENT_TIME_FILTER
-            )
-            .values_list(
-                "start_time",
-                "end_time",
-                "date",
-                "appointment_type",
-                "location__name",
-                named=True,
-            )
-            .distinct()
-        )
-
-        appointments_to_send = (
-            last_found_appointments - last_sent_appointments
-        ) | new_appointments
-    except ScraperRun.DoesNotExist:
-        appointments_to_send = last_found_appointments
+    if block_cache is None:
+        block_cache = {}
+    appointment_types = {
+        appointment_type.pk: appointment_type
+        for appointment_type in notification.appointment_type.all()
+    }
 
     appointments_to_send = list(
-        filter_appointments_by_type(
-            appointments_to_send, appointment_types.values_list("pk", flat=True)
-        )
+        filter_appointments_by_type(new_appointments, appointment_types)
     )
 
     if len(appointments_to_send) <= 0:
         return None
 
+    # the rows returned by values_list(named=True) can not be pickled
     appointments_to_send = sorted(
-        list(appointments_to_send), key=lambda x: x.start_time
+        [AppointmentTuple(*appointment) for appointment in appointments_to_send],
+        key=lambda x: x.start_time,
     )
     appointments_to_send.sort(key=lambda x: x.date)
     appointments_to_send.sort(
-        key=lambda x: appointment_types_to_category[x.appointment_type]
+        key=lambda x: appointment_types[x.appointment_type].appointment_category_id
     )
 
-    appointment_types_list = create_appointment_type_list_from_list(
-        appointments_to_send
-    )
+    appointments_by_type: dict[int, list[AppointmentTuple]] = {}
+    for appointment in appointments_to_send:
+        appointments_by_type.setdefault(appointment.appointment_type, []).append(
+            appointment
+        )
 
-    return create_notification_email_message(
+    appointment_types_list = []
+    for appointment_type, appointments in appointments_by_type.items():
+        key = (
+            appointment_type,
+            notification.language,
+            notification.last_notified_run_id,
+        )
+        if key not in block_cache:
+            block_cache[key] = render_appointment_type_block(
+                appointment_types[appointment_type],
+                appointments,
+                notification.language,
+            )
+        appointment_types_list.append(block_cache[key])
+
+    return create_notification_email_payload(
         protocol,
         notification,
         len(appointments_to_send),
         appointment_types_list,
     )
+
+
+def create_notification_email_message_for_new_appointments(
+    notification: Notification,
+    new_appointments: set[AppointmentTuple],
+    protocol: str,
+) -> None | mail.EmailMultiAlternatives:
+    """
+    create_notification_email_message_for_new_appointments creates an email message for a notification with the correct appointments
+
+    Args:
+        notification (Notification): the notification to create the email for
+        new_appointments (set[AppointmentTuple]): the appointments found since the last notified scraper run of the notification,
+            see get_appointments_since
+        protocol (str): the protocol to use for the links
+
+    Returns:
+        None | mail.EmailMultiAlternatives: the email message or None if no new appointments were found
+    """
+    payload = create_notification_email_payload_for_new_appointments(
+        notification, new_appointments, protocol
+    )
+    if payload is None:
+        return None
+    return render_notification_email(payload)
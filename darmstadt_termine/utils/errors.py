@@ -0,0 +1,92 @@
+from typing import NamedTuple
+
+from asgiref.sync import sync_to_async
+from django.core.mail import mail_admins
+
+
+class ErrorRecord(NamedTuple):
+    count: int
+    contexts: list[str]
+
+
+class ErrorCollector:
+    """
+    ErrorCollector records the errors of a scraper run, so that they can be reported in a single mail after the run.
+    Equal errors are reported once with the amount of occurrences and some of the contexts they occurred in.
+    The mail is bounded, at most max_errors distinct errors with details of at most max_detail_length characters are reported.
+    It is only used from the event loop, therefore recording an error never blocks.
+    """
+
+    def __init__(
+        self, max_errors: int = 20, max_detail_length: int = 2000, max_contexts: int = 5
+    ) -> None:
+        """
+        Args:
+            max_errors (int, optional): the maximum amount of distinct errors which are reported. Defaults to 20.
+            max_detail_length (int, optional): the maximum length of the details of an error. Defaults to 2000.
+            max_contexts (int, optional): the maximum amount of contexts reported per error. Defaults to 5.
+        """
+        self.max_errors = max_errors
+        self.max_detail_length = max_detail_length
+        self.max_contexts = max_contexts
+        self.errors: dict[tuple[str, str], ErrorRecord] = {}
+        self.count = 0
+        self.dropped = 0
+
+    def add(self, title: str, detail: str = "", context: str = ""):
+        """
+        add records an error, errors with the same title and details are counted together
+
+        Args:
+            title (str): the kind of the error
+            detail (str, optional): the details of the error, for example the exception message. Defaults to "".
+            context (str, optional): where the error occurred, for example the url. Defaults to "".
+        """
+        self.count += 1
+        if len(detail) > self.max_detail_length:
+            detail = detail[: self.max_detail_length] + "…"
+        key = (title, detail)
+        if key not in self.errors:
+            if len(self.errors) >= self.max_errors:
+                self.dropped += 1
+                return
+            self.errors[key] = ErrorRecord(0, [])
+
+        count, contexts = self.errors[key]
+        if context and len(contexts) < self.max_contexts:
+            contexts.append(context)
+        self.errors[key] = ErrorRecord(count + 1, contexts)
+
+    def summary(self) -> str:
+        """
+        summary creates the text of the report
+        """
+        lines = [f"Der Scraper hat {self.count} Fehler festgestellt.", ""]
+        for (title, detail), (count, contexts) in self.errors.items():
+            lines.append(f"{count}x {title}")
+            if contexts:
+                more = count - len(contexts)
+                lines.append(
+                    "Aufgetreten bei: "
+                    + ", ".join(contexts)
+                    + (f" und {more} weiteren" if more > 0 else "")
+                )
+            if detail:
+                lines.append(detail)
+            lines.append("")
+        if self.dropped:
+            lines.append(f"{self.dropped} weitere Fehler wurden nicht aufgeführt.")
+        return "\n".join(lines)
+
+    async def asend(self, subject: str):
+        """
+        asend mails the report to the admins from a worker thread, if any errors were recorded
+
+        Args:
+            subject (str): the subject of the mail
+        """
+        if not self.count:
+            return
+        await sync_to_async(mail_admins, thread_sensitive=False)(
+            subject, self.summary()
+        )
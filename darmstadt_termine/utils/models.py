@@ -1,10 +1,10 @@
 import datetime
 from typing import Iterable, Iterator, NamedTuple, TypedDict
 
-from django.db.models import Max, Min, Q
+from django.db.models import Max, Min, Q, QuerySet
 from django.utils import timezone
 
-from ..models import AppointmentType, Location
+from ..models import Appointment, AppointmentType, Location, ScraperRun
 
 APPOINTMENT_TIME_FILTER = (
     Q(date__gt=timezone.now())
@@ -12,6 +12,48 @@ APPOINTMENT_TIME_FILTER = (
 )
 
 
+def get_scraper_run_appointments(scraper_run: ScraperRun) -> QuerySet[Appointment]:
+    """
+    get_scraper_run_appointments returns all appointments which were available in the scraper run
+
+    Args:
+        scraper_run (ScraperRun): the scraper run
+
+    Returns:
+        QuerySet[Appointment]: the appointments available in the scraper run
+    """
+    return Appointment.objects.filter(
+        availabilities__first_seen_run__lte=scraper_run.pk,
+        availabilities__last_seen_run__gte=scraper_run.pk,
+    )
+
+
+def get_added_appointments(
+    scraper_run: ScraperRun, since_scraper_run: ScraperRun | None = None
+) -> QuerySet[Appointment]:
+    """
+    get_added_appointments returns all appointments which became available in the scraper run
+    or in any scraper run after since_scraper_run up to the scraper run.
+    They are read from the :model:`darmstadt_termine.AppointmentChange`s written by the scraper.
+
+    Args:
+        scraper_run (ScraperRun): the last scraper run
+        since_scraper_run (ScraperRun | None, optional): the scraper run before the first one to include. Defaults to None, which only includes the scraper run.
+
+    Returns:
+        QuerySet[Appointment]: the added appointments
+    """
+    if since_scraper_run is None:
+        return Appointment.objects.filter(
+            changes__scraper_run=scraper_run, changes__added=True
+        )
+    return Appointment.objects.filter(
+        changes__scraper_run__gt=since_scraper_run.pk,
+        changes__scraper_run__lte=scraper_run.pk,
+        changes__added=True,
+    )
+
+
 class AppointmentTuple(NamedTuple):
     start_time: datetime.time
     end_time: datetime.time
@@ -20,6 +62,42 @@ class AppointmentTuple(NamedTuple):
     location__name: str
 
 
+def get_appointments_since(
+    last_scraper_run: ScraperRun,
+    since_scraper_run: ScraperRun | None,
+    last_found_appointments: set[AppointmentTuple],
+) -> set[AppointmentTuple]:
+    """
+    get_appointments_since returns the appointments found in the last scraper run which were added after since_scraper_run.
+    It is computed once for all notifications with the same last notified scraper run.
+
+    Args:
+        last_scraper_run (ScraperRun): the last scraper run
+        since_scraper_run (ScraperRun | None): the last notified scraper run, None if the notification was never sent
+        last_found_appointments (set[AppointmentTuple]): the appointments found in the last scraper run
+
+    Returns:
+        set[AppointmentTuple]: the appointments which were not sent yet
+    """
+    if since_scraper_run is None:
+        return last_found_appointments
+    if since_scraper_run.pk >= last_scraper_run.pk:
+        return set()
+    return last_found_appointments & set(
+        get_added_appointments(last_scraper_run, since_scraper_run)
+        .filter(*APPOINTMENT_TIME_FILTER)
+        .values_list(
+            "start_time",
+            "end_time",
+            "date",
+            "appointment_type",
+            "location__name",
+            named=True,
+        )
+        .distinct()
+    )
+
+
 class AppointmentTypeDict(TypedDict):
     name: str
     appointment_category: str
@@ -0,0 +1,180 @@
+import datetime
+import logging
+import uuid
+
+from django.core import mail
+from django.db.models import F
+from django.utils import timezone
+
+from ..conf import settings
+from ..models import Notification, OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryResult:
+    """
+    DeliveryResult counts the emails delivered by deliver_outbox.
+    """
+
+    def __init__(self) -> None:
+        self.sent = 0
+        self.failed = 0
+        self.given_up = 0
+
+
+def create_outbox_message(
+    email_message: mail.EmailMultiAlternatives, notification: Notification | None = None
+) -> OutboxMessage:
+    """
+    create_outbox_message creates an unsaved outbox message from an email message with a single recipient
+
+    Args:
+        email_message (mail.EmailMultiAlternatives): the email message
+        notification (Notification | None, optional): the notification the email is sent for. Defaults to None.
+
+    Returns:
+        OutboxMessage: the outbox message
+    """
+    html_body = next(
+        (
+            content
+            for content, mimetype in email_message.alternatives
+            if mimetype == "text/html"
+        ),
+        "",
+    )
+    return OutboxMessage(
+        notification=notification,
+        email=email_message.to[0],
+        subject=str(email_message.subject),
+        body=email_message.body,
+        html_body=html_body,
+    )
+
+
+def create_email_message(outbox_message: OutboxMessage) -> mail.EmailMultiAlternatives:
+    """
+    create_email_message creates the email message to deliver an outbox message
+
+    Args:
+        outbox_message (OutboxMessage): the outbox message
+
+    Returns:
+        mail.EmailMultiAlternatives: the email message
+    """
+    email_message = mail.EmailMultiAlternatives(
+        outbox_message.subject, outbox_message.body, None, [outbox_message.email]
+    )
+    if outbox_message.html_body:
+        email_message.attach_alternative(outbox_message.html_body, "text/html")
+    return email_message
+
+
+def get_retry_delay(attempts: int) -> datetime.timedelta:
+    """
+    get_retry_delay returns how long to wait before the next attempt, the delay doubles with every failed attempt
+
+    Args:
+        attempts (int): the amount of failed attempts
+
+    Returns:
+        datetime.timedelta: the delay
+    """
+    return datetime.timedelta(
+        seconds=settings.DARMSTADT_TERMINE_OUTBOX_RETRY_BACKOFF * 2 ** (attempts - 1)
+    )
+
+
+def claim_outbox_messages(
+    start_time: datetime.datetime, batch_size: int, max_attempts: int
+) -> list[OutboxMessage] | None:
+    """
+    claim_outbox_messages claims up to batch_size outbox messages which were due at start_time with a single conditional update.
+    The claim is stored in the messages and next_attempt is moved to when the claim expires,
+    so that other processes skip them until then. The attempt is counted when the message is claimed.
+
+    Args:
+        start_time (datetime.datetime): the time the messages have to be due at
+        batch_size (int): the maximum amount of messages
+        max_attempts (int): the amount of attempts per message
+
+    Returns:
+        list[OutboxMessage] | None: the claimed messages, None if no message is due
+    """
+    due_messages = OutboxMessage.objects.filter(
+        sent__isnull=True, attempts__lt=max_attempts, next_attempt__lte=start_time
+    )
+    pks = list(
+        due_messages.order_by("next_attempt", "pk").values_list("pk", flat=True)[
+            :batch_size
+        ]
+    )
+    if not pks:
+        return None
+
+    claim = uuid.uuid4().hex
+    # the conditions are checked again by the update, messages claimed by another process in between are skipped
+    due_messages.filter(pk__in=pks).update(
+        claim=claim,
+        attempts=F("attempts") + 1,
+        next_attempt=timezone.now()
+        + datetime.timedelta(seconds=settings.DARMSTADT_TERMINE_OUTBOX_CLAIM_TIMEOUT),
+    )
+    return list(OutboxMessage.objects.filter(pk__in=pks, claim=claim).order_by("pk"))
+
+
+def deliver_outbox(
+    batch_size: int | None = None, max_attempts: int | None = None
+) -> DeliveryResult:
+    """
+    deliver_outbox delivers all due outbox messages in batches of batch_size over a single mail connection.
+    Every batch is claimed with claim_outbox_messages before it is delivered, so that multiple processes can deliver the outbox at the same time.
+    No transaction is held while sending, every message is marked as sent or failed right after it was sent.
+    A failed message is retried after get_retry_delay until it was attempted max_attempts times.
+
+    Args:
+        batch_size (int | None, optional): the amount of messages delivered per batch. Defaults to OUTBOX_BATCH_SIZE.
+        max_attempts (int | None, optional): the amount of attempts per message. Defaults to OUTBOX_MAX_ATTEMPTS.
+
+    Returns:
+        DeliveryResult: the amount of sent, failed and given up messages
+    """
+    batch_size = batch_size or settings.DARMSTADT_TERMINE_OUTBOX_BATCH_SIZE
+    max_attempts = max_attempts or settings.DARMSTADT_TERMINE_OUTBOX_MAX_ATTEMPTS
+    result = DeliveryResult()
+    # messages which failed in this call are not retried before it returns
+    start_time = timezone.now()
+
+    with mail.get_connection() as connection:
+        while (
+            outbox_messages := claim_outbox_messages(
+                start_time, batch_size, max_attempts
+            )
+        ) is not None:
+            for outbox_message in outbox_messages:
+                claimed_message = OutboxMessage.objects.filter(
+                    pk=outbox_message.pk, claim=outbox_message.claim
+                )
+                try:
+                    connection.send_messages([create_email_message(outbox_message)])
+                except Exception as error:
+                    logger.warning(
+                        "Delivering email %s failed: %s", outbox_message.pk, error
+                    )
+                    claimed_message.update(
+                        claim="",
+                        last_error=str(error),
+                        next_attempt=timezone.now()
+                        + get_retry_delay(outbox_message.attempts),
+                    )
+                    if outbox_message.attempts >= max_attempts:
+                        result.given_up += 1
+                    else:
+                        result.failed += 1
+                    # the connection may be broken, it is opened again for the next message
+                    connection.close()
+                else:
+                    claimed_message.update(claim="", sent=timezone.now())
+                    result.sent += 1
+    return result
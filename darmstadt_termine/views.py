@@ -24,6 +24,7 @@ from .tokens import (
 from .utils.models import (
     APPOINTMENT_TIME_FILTER,
     create_appointment_type_list_from_list,
+    get_scraper_run_appointments,
 )
 from .utils.site import get_site_name_domain
 
@@ -45,10 +46,13 @@ def get_notification_b64id(idb64: str) -> Notification:
 
 def index(request: HttpRequest) -> HttpResponse:
     try:
-        last_scraper_run = ScraperRun.objects.latest("start_time")
+        last_scraper_run = ScraperRun.objects.filter(
+            status=ScraperRun.Status.COMPLETED
+        ).latest("start_time")
 
         last_found_appointments = list(
-            last_scraper_run.appointments.filter(
+            get_scraper_run_appointments(last_scraper_run)
+            .filter(
                 *APPOINTMENT_TIME_FILTER,
             )
             .order_by("appointment_type__appointment_category", "date", "start_time")